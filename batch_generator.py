@@ -0,0 +1,3 @@
+from map_maker.batch import main
+
+main()
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+Benchmarks for building, drawing, exporting and saving dungeons.
+
+    python benchmarks/benchmark.py                              # the quick suite, results to benchmark.json
+    python benchmarks/benchmark.py --suite full -o full.json    # every size, tile percent and floor count
+    python benchmarks/benchmark.py --compare baseline.json      # flag cases that got slower or bigger
+
+Each case records its best wall time over the repeats, its peak traced memory and, for builds, the carved tiles
+per second. The times come from untraced runs and the memory from one more run with tracemalloc on, since tracing
+slows the code down many times over. Drawing goes through the CanvasRenderer the display uses, onto a canvas that
+only counts its items. With --compare, a case is a regression when its time or peak memory is more than --threshold
+above the baseline case with the same name and engine; the script then exits with status 1.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from map_maker import raster, storage
+from map_maker.dungeon import WALL, Dungeon
+from map_maker.renderer import CanvasRenderer
+from my_global import *
+
+SUITES = {
+    'quick': {'sizes': [6, 50, 200], 'percents': [0.05, 0.2, 0.5], 'floors': [1, 5]},
+    'full': {'sizes': [6, 50, 100, 250, 500, 1000], 'percents': [0.05, 0.2, 0.5, 0.9], 'floors': [1, 5, 30]},
+}
+SEED = 12345
+NOISE = {'seconds': 0.001, 'peak_bytes': 64 * 1024}  # smaller differences than these are never regressions
+
+
+class CountingCanvas:
+    """ A stand-in for a tkinter Canvas that only counts the items drawn on it, so drawing can be timed headless. """
+
+    def __init__(self):
+        self.items = 0
+
+    def config(self, **options):
+        pass
+
+    def create_rectangle(self, *coords, **options):
+        self.items += 1
+        return self.items
+
+    create_polygon = create_text = create_rectangle
+
+    def coords(self, item, *coords):
+        pass
+
+    def itemconfig(self, item, **options):
+        pass
+
+    def delete(self, *items):
+        pass
+
+
+def measure(function, repeat: int) -> tuple:
+    """
+    Run a function several times to time it, then once more with tracemalloc on to get its peak memory.
+
+    :param function: the function to run, called with no arguments
+    :param repeat: the number of timed runs
+    :return: the best wall time in seconds, the peak traced memory in bytes, and the result of the last timed run
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def make_dungeon(size: int, percent: float, floors: int, engine: str) -> Dungeon:
+    return Dungeon(grid_columns=size, grid_rows=size, top_floor=floors - 1, bottom_floor=0, tile_percent=percent,
+                   seed=SEED, engine=engine)
+
+
+def draw_floor(dungeon: Dungeon) -> CountingCanvas:
+    """ Draw floor 0 from scratch the way the display does, onto a fresh counting canvas. """
+    renderer = CanvasRenderer(None, dungeon)
+    renderer._canvas = CountingCanvas()
+    return renderer.draw(0)
+
+
+def carved_tiles(dungeon: Dungeon) -> int:
+    return int(np.sum([np.count_nonzero(floor.tiles != WALL) for floor in dungeon.floors.values()]))
+
+
+def run(sizes, percents, floors, engine: str = 'frontier', repeat: int = 3, report=print) -> list:
+    """
+    Run every benchmark case.
+
+    :param sizes: the grid widths/heights to build
+    :param percents: the tile percents to build
+    :param floors: the floor counts to build
+    :param engine: the carving engine (default 'frontier')
+    :param repeat: the number of runs per case (default 3)
+    :param report: called with a line of text per finished case. Use None to stay quiet. (default print)
+    :return: the results, one dict per case
+    """
+    results = []
+    make_dungeon(6, 0.2, 1, engine).build()  # warm up numpy and the imports so the first case is not charged for it
+
+    def record(name, params, seconds, peak, **extra):
+        result = {'name': name, 'params': params, 'seconds': seconds, 'peak_bytes': peak, **extra}
+        results.append(result)
+        if report is not None:
+            report('%-48s %9.4f s %10.1f KiB%s' % (name, seconds, peak / 1024, ''.join(
+                '  %s=%.0f' % (key, value) for key, value in extra.items())))
+
+    for size in sizes:
+        for percent in percents:
+            for floor_count in floors:
+                params = {'size': size, 'tile_percent': percent, 'floors': floor_count, 'engine': engine}
+                name = 'build/%dx%d/%g/%d' % (size, size, percent, floor_count)
+
+                def build():
+                    dungeon = make_dungeon(size, percent, floor_count, engine)
+                    dungeon.build()
+                    return dungeon
+
+                seconds, peak, dungeon = measure(build, repeat)
+                record(name, params, seconds, peak, tiles_per_second=carved_tiles(dungeon) / seconds)
+
+        # drawing, exporting and saving only depend on the grid, so they run once per size
+        dungeon = make_dungeon(size, percents[0], 1, engine)
+        dungeon.build()
+        floor = dungeon.floors[0]
+        params = {'size': size, 'tile_percent': percents[0], 'floors': 1, 'engine': engine}
+
+        seconds, peak, _ = measure(lambda: draw_floor(dungeon), repeat)
+        record('draw/%dx%d' % (size, size), params, seconds, peak)
+
+        seconds, peak, _ = measure(lambda: raster.png_bytes(raster.floor_image(floor)), repeat)
+        record('png/%dx%d' % (size, size), params, seconds, peak)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dungeon.dgn')
+            seconds, peak, _ = measure(lambda: storage.save(dungeon, path), repeat)
+            record('save/%dx%d' % (size, size), params, seconds, peak)
+
+            seconds, peak, _ = measure(lambda: storage.load(path).floors[0].tiles.sum(), repeat)
+            record('load/%dx%d' % (size, size), params, seconds, peak)
+
+    return results
+
+
+def case_key(result: dict) -> tuple:
+    """ What a case is matched on between runs: its name and the engine it ran with. """
+    return result['name'], result['params'].get('engine')
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    Find the cases that got slower or use more memory than in a baseline run. A case is only compared with the
+    baseline case of the same name and engine.
+
+    :param results: the results of this run
+    :param baseline: the results of the baseline run
+    :param threshold: how much worse a case may get before it counts, as a fraction such as 0.2 for 20%. Differences
+        below NOISE never count.
+    :return: a line of text per regression
+    """
+    old = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = old.get(case_key(result))
+        if before is None:
+            continue
+        for key, unit in (('seconds', 's'), ('peak_bytes', 'B')):
+            if result[key] > before[key] * (1 + threshold) and result[key] - before[key] > NOISE[key]:
+                regressions.append('%s: %s went from %.4g %s to %.4g %s (+%.0f%%)' % (
+                    result['name'], key, before[key], unit, result[key], unit,
+                    (result[key] / before[key] - 1) * 100))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark building, drawing, exporting and saving dungeons.')
+    parser.add_argument('--suite', choices=SUITES, default='quick', help='the set of cases to run (default quick)')
+    parser.add_argument('--sizes', help='grid widths/heights to use instead of the suite\'s, such as 6,50,1000')
+    parser.add_argument('--percents', help='tile percents to use instead of the suite\'s, such as 0.05,0.9')
+    parser.add_argument('--floors', help='floor counts to use instead of the suite\'s, such as 1,30')
+    parser.add_argument('--engine', default='frontier', help='the carving engine (default frontier)')
+    parser.add_argument('--repeat', type=int, default=3, help='the runs per case; the best time is kept (default 3)')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='the results file (default benchmark.json)')
+    parser.add_argument('--compare', help='a results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the fraction a case may get worse before it is a regression (default 0.2)')
+    args = parser.parse_args(argv)
+
+    suite = SUITES[args.suite]
+    sizes = [int(value) for value in args.sizes.split(',')] if args.sizes else suite['sizes']
+    percents = [float(value) for value in args.percents.split(',')] if args.percents else suite['percents']
+    floors = [int(value) for value in args.floors.split(',')] if args.floors else suite['floors']
+
+    results = run(sizes, percents, floors, args.engine, args.repeat)
+    with open(args.output, 'w') as file:
+        json.dump({
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        if not {case_key(result) for result in baseline} & {case_key(result) for result in results}:
+            print('no cases in common with %s; was it run with another engine?' % args.compare)
+            sys.exit(1)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against ' + args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from my_global import *
+
+UNREACHED = -1  # the distance of a cell no source can reach, and the component of a cell that cannot be walked on
+
+
+def padded(walkable: np.ndarray) -> tuple:
+    """
+    Flatten a mask with a border of unwalkable cells around it, so the neighbors of a cell are just fixed offsets
+    from its index and never fall off the grid.
+
+    :param walkable: a bool array (rows by columns) of the cells that can be walked on
+    :return: the flat padded mask, and the index offsets of the cells above, below, left of and right of a cell
+    """
+    rows, columns = walkable.shape
+    stride = columns + 2
+    grid = np.zeros((rows + 2, stride), dtype=bool)
+    grid[1:-1, 1:-1] = walkable
+    return grid.ravel(), np.array([-stride, stride, -1, 1])
+
+
+def distance_field(walkable: np.ndarray, sources: np.ndarray, limit: float = None, until: np.ndarray = None) \
+        -> np.ndarray:
+    """
+    Get the number of steps from each cell to the nearest source, moving up, down, left and right over walkable
+    cells. The search goes one step at a time for every source at once, and only touches the cells at the edge of
+    what has been reached, so it costs about the number of walkable cells plus a few array calls per step.
+        >>> distance_field(np.array([[1, 1, 0, 1], [0, 1, 1, 1]], dtype=bool), np.array([[0, 0]]))
+        array([[ 0,  1, -1,  5],
+               [-1,  2,  3,  4]], dtype=int32)
+
+    :param walkable: a bool array (rows by columns) of the cells that can be walked on
+    :param sources: an int array (sources by 2) of the (row, column) of each cell to measure from
+    :param limit: stop after this many steps, leaving the cells further away UNREACHED. Use None to go on until
+        every cell that can be reached is. (default None)
+    :param until: an int array (cells by 2) of the (row, column) of cells to stop at once they are all reached, so
+        only the cells that are no further away than the furthest of them get a distance. Use None to not stop
+        early. (default None)
+    :return: an int32 array (rows by columns) of the steps to the nearest source, or UNREACHED (-1) for cells that
+        cannot be reached
+    """
+    rows, columns = walkable.shape
+    flat, offsets = padded(walkable)
+    distances = np.full(flat.size, UNREACHED, dtype=np.int32)
+
+    sources = np.asarray(sources, dtype=np.intp).reshape(-1, 2)
+    frontier = np.unique((sources[:, 0] + 1) * (columns + 2) + sources[:, 1] + 1)
+    distances[frontier] = 0
+    if until is not None:
+        until = np.asarray(until, dtype=np.intp).reshape(-1, 2)
+        until = (until[:, 0] + 1) * (columns + 2) + until[:, 1] + 1
+    step = 0
+    while frontier.size and (limit is None or step < limit):
+        if until is not None:
+            until = until[distances[until] == UNREACHED]
+            if until.size == 0:
+                break
+        step += 1
+        reached = (frontier[:, None] + offsets).ravel()
+        reached = np.unique(reached[flat[reached] & (distances[reached] == UNREACHED)])
+        distances[reached] = step
+        frontier = reached
+
+    return distances.reshape(rows + 2, columns + 2)[1:-1, 1:-1].copy()
+
+
+def neighbor_counts(walkable: np.ndarray) -> np.ndarray:
+    """
+    Get the number of walkable cells above, below, left of and right of each cell.
+
+    :param walkable: a bool array (rows by columns) of the cells that can be walked on
+    :return: a uint8 array (rows by columns) of counts from 0 to 4
+    """
+    grid = np.pad(walkable, 1).astype(np.uint8)
+    return grid[:-2, 1:-1] + grid[2:, 1:-1] + grid[1:-1, :-2] + grid[1:-1, 2:]
+
+
+def dead_ends(walkable: np.ndarray) -> np.ndarray:
+    """
+    Find the dead ends: the walkable cells with exactly one walkable neighbor.
+        >>> dead_ends(np.array([[1, 1, 1], [0, 1, 0]], dtype=bool))
+        array([[ True, False,  True],
+               [False,  True, False]])
+
+    :param walkable: a bool array (rows by columns) of the cells that can be walked on
+    :return: a bool array (rows by columns) that is True at each dead end
+    """
+    return walkable & (neighbor_counts(walkable) == 1)
+
+
+def components(walkable: np.ndarray) -> tuple:
+    """
+    Label the connected components: the groups of walkable cells that can be walked between. Every cell starts as
+    its own group, and each round joins the groups at either end of a step between two groups, each to the lowest
+    numbered one, then points every cell straight at the root of its group. Steps inside one group are dropped as
+    they are found, so the rounds keep getting cheaper, and only a few are needed.
+        >>> components(np.array([[1, 0, 1], [1, 0, 1], [0, 0, 1]], dtype=bool))
+        (array([[ 0, -1,  1],
+               [ 0, -1,  1],
+               [-1, -1,  1]], dtype=int32), 2)
+
+    :param walkable: a bool array (rows by columns) of the cells that can be walked on
+    :return: an int32 array (rows by columns) of the component of each cell, numbered from 0 in the order their
+        first cells come in row by row, or UNREACHED (-1) for cells that cannot be walked on, and the number of
+        components
+    """
+    ids = np.full(walkable.shape, -1, dtype=np.intp)
+    count = int(np.count_nonzero(walkable))
+    ids[walkable] = np.arange(count)
+
+    across = walkable[:, :-1] & walkable[:, 1:]
+    down = walkable[:-1] & walkable[1:]
+    first = np.concatenate([ids[:, :-1][across], ids[:-1][down]])
+    second = np.concatenate([ids[:, 1:][across], ids[1:][down]])
+
+    parent = np.arange(count)
+    while True:
+        first_root, second_root = parent[first], parent[second]
+        between = first_root != second_root
+        if not between.any():
+            break
+        first, second = first[between], second[between]
+        first_root, second_root = first_root[between], second_root[between]
+        np.minimum.at(parent, np.maximum(first_root, second_root), np.minimum(first_root, second_root))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    roots, labels = np.unique(parent, return_inverse=True)
+    result = np.full(walkable.shape, UNREACHED, dtype=np.int32)
+    result[walkable] = labels
+    return result, roots.size
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from map_maker import storage
+from map_maker.carving import ENGINES
+from map_maker.dungeon import Dungeon
+from map_maker.placement import FEATURES
+
+
+def parse_seeds(text: str) -> list:
+    """
+    Read a list of seeds made of single seeds and inclusive ranges.
+        >>> parse_seeds('3,10-12, 7')
+        [3, 10, 11, 12, 7]
+
+    :param text: the seeds separated by commas
+    :return: the seeds
+    """
+    seeds = []
+    for part in text.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-')
+            seeds.extend(range(int(first), int(last) + 1))
+        elif part:
+            seeds.append(int(part))
+    return seeds
+
+
+def dungeon_path(directory: str, seed: int) -> str:
+    """
+    Get the file a dungeon of the batch is saved to.
+
+    :param directory: the folder the batch is saved in
+    :param seed: the seed of the dungeon
+    :return: the path of the file
+    """
+    return os.path.join(directory, 'dungeon_%d.dgn' % seed)
+
+
+def generate(seed: int, directory: str, settings: dict) -> int:
+    """
+    Build one dungeon and save it in the binary dungeon format. The file is written under a temporary name and then
+    renamed, so an interrupted run never leaves a half written dungeon behind.
+
+    :param seed: the seed of the dungeon
+    :param directory: the folder the batch is saved in
+    :param settings: the other keyword arguments for Dungeon
+    :return: the seed
+    """
+    storage.save(Dungeon(seed=seed, **settings), dungeon_path(directory, seed))
+    return seed
+
+
+def generate_batch(seeds, directory: str, workers: int = 0, report=print, report_every: float = 5.0,
+                   **settings) -> dict:
+    """
+    Build a dungeon for each seed and save them to a folder as they finish. Seeds that already have a saved dungeon
+    are skipped, so running the same batch again resumes it.
+
+    :param seeds: the seeds to build
+    :param directory: the folder the dungeons are saved in. It is created if needed.
+    :param workers: the number of processes that build dungeons at the same time. Use 1 to build them one after
+        another in this process, or 0 to use one process per CPU. (default 0)
+    :param report: called with a line of progress text every report_every seconds and at the end. Use None to stay
+        quiet. (default print)
+    :param report_every: the number of seconds between progress reports (default 5 seconds)
+    :param settings: the keyword arguments for Dungeon, such as grid_columns, top_floor or tile_percent
+    :return: the number of dungeons generated and skipped, the seconds it took, and the dungeons per second
+    """
+    os.makedirs(directory, exist_ok=True)
+    seeds = list(seeds)
+    todo = [seed for seed in seeds if not os.path.exists(dungeon_path(directory, seed))]
+    skipped = len(seeds) - len(todo)
+
+    start = time.perf_counter()
+    last_report = start
+    done = 0
+
+    def progress(final=False):
+        seconds = time.perf_counter() - start
+        rate = done / seconds if seconds > 0 else 0.0
+        if report is not None:
+            report('%s%d/%d dungeons%s, %.1f dungeons/s' % ('done: ' if final else '', done, len(todo),
+                                                          ' (%d already saved)' % skipped if skipped else '', rate))
+        return seconds, rate
+
+    if workers == 1:
+        for seed in todo:
+            generate(seed, directory, settings)
+            done += 1
+            if time.perf_counter() - last_report >= report_every:
+                progress()
+                last_report = time.perf_counter()
+    else:
+        with ProcessPoolExecutor(workers or None) as executor:
+            pending = set()
+            queue = iter(todo)
+            limit = (workers or os.cpu_count() or 1) * 4  # keep a few jobs queued per worker, not the whole batch
+            while True:
+                for seed in queue:
+                    pending.add(executor.submit(generate, seed, directory, settings))
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    break
+
+                finished, pending = wait(pending, timeout=report_every, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    done += 1
+                if time.perf_counter() - last_report >= report_every:
+                    progress()
+                    last_report = time.perf_counter()
+
+    seconds, rate = progress(final=True)
+    return {'generated': done, 'skipped': skipped, 'seconds': seconds, 'rate': rate}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a batch of dungeons and save them to a folder.')
+    parser.add_argument('seeds', help='the seeds to generate, such as "0-9999" or "1,5,20-30"')
+    parser.add_argument('-o', '--output', default='dungeons', help='the folder to save to (default dungeons)')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='the number of processes; 0 for one per CPU, 1 to run in this process (default 0)')
+    parser.add_argument('--columns', type=int, default=50, help='the number of grid columns (default 50)')
+    parser.add_argument('--rows', type=int, default=35, help='the number of grid rows (default 35)')
+    parser.add_argument('--top-floor', default='', help='the top floor number (default random)')
+    parser.add_argument('--bottom-floor', default='', help='the bottom floor number (default random)')
+    parser.add_argument('--tile-count', type=int, default=0,
+                        help='the number of floor tiles; 0 to use --tile-percent (default 0)')
+    parser.add_argument('--tile-percent', type=float, default=0.2,
+                        help='the share of the grid that becomes floor tiles (default 0.2)')
+    parser.add_argument('--engine', choices=ENGINES, default='frontier',
+                        help='how the floors are carved; compat walks like the pre-batching carver (default frontier)')
+    parser.add_argument('--features', action='store_true',
+                        help='place treasure, pits, cracked walls and cracked floors by the default rules')
+    parser.add_argument('--report-every', type=float, default=5.0,
+                        help='the seconds between progress reports (default 5)')
+    args = parser.parse_args(argv)
+
+    generate_batch(parse_seeds(args.seeds), args.output, workers=args.workers, report_every=args.report_every,
+                   grid_columns=args.columns, grid_rows=args.rows,
+                   top_floor=args.top_floor, bottom_floor=args.bottom_floor,
+                   tile_count=args.tile_count, tile_percent=args.tile_percent, engine=args.engine,
+                   features=FEATURES if args.features else None)
+
+
+if __name__ == '__main__':
+    main()
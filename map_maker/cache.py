@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+from my_global import *
+
+CACHE_VERSION = 1  # part of every key; raise it when a change to the generator changes the maps it makes
+COMPRESSION = 1  # the zlib level the tiles are kept at; the maps are mostly walls, so even level 1 packs them well
+
+
+class DungeonCache:
+    """
+    A cache of carved floors, so dungeons that were built before are not carved again. Give it to a dungeon and
+    build as usual:
+
+        cache = DungeonCache(max_bytes=64 * 1024 * 1024, directory='dungeon_cache')
+        dungeon = Dungeon(seed=42, cache=cache)
+        dungeon.build()
+
+    Each floor is stored under a hash of everything that decides how it comes out (see key()), so the cache never
+    gives a floor of different settings. The entries and staircases are still placed by the build, as they are cheap
+    and tie the floors together; only the carving is skipped.
+
+    Floors are kept compressed in memory, with the least recently used ones dropped once they take more than
+    max_bytes. With a directory, floors are also written there and read back when they are not in memory. Files are
+    written under a temporary name and renamed, so worker processes, or separate programs, can share a directory.
+    A cache can be pickled to send it to a worker process, where it starts with an empty memory tier.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, directory: str = None):
+        """
+        Create a new, empty, cache.
+
+        :param max_bytes: the most the compressed floors kept in memory may take (default 64 MiB)
+        :param directory: the directory for the on-disk tier. It is made if needed. Use None to only keep floors in
+            memory. (default None)
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self.entries = OrderedDict()  # the compressed tiles of each floor, keyed by key, least recently used first
+        self.size = 0  # the bytes of the compressed tiles in memory
+        self.hits = 0  # floors found in memory
+        self.disk_hits = 0  # floors found on disk
+        self.misses = 0  # floors found in neither
+        self.evictions = 0  # floors dropped from memory to stay within max_bytes
+        self.lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        return {'max_bytes': self.max_bytes, 'directory': self.directory}
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    @staticmethod
+    def key(dungeon, floor_number: int) -> str:
+        """
+        Get the key of a floor of a dungeon. It covers the seed, the grid size, the floor range (which decides where
+        the staircases go), the number of tiles to carve, the engine and the floor, and nothing that only changes how
+        the map is drawn.
+
+        :param dungeon: the dungeon
+        :param floor_number: the number of the floor
+        :return: a hex SHA-256 hash
+        """
+        parts = {
+            'version': CACHE_VERSION,
+            'seed': dungeon.active_seed,
+            'columns': dungeon.grid_size.columns,
+            'rows': dungeon.grid_size.rows,
+            'top_floor': dungeon.top_floor,
+            'bottom_floor': dungeon.bottom_floor,
+            'tiles': dungeon.total_links(),
+            'engine': dungeon.engine,
+            'floor': floor_number,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        """ The file of a floor in the on-disk tier. """
+        return os.path.join(self.directory, key + '.tiles')
+
+    def get(self, key: str, shape: tuple) -> np.ndarray:
+        """
+        Look up a floor.
+
+        :param key: the key of the floor
+        :param shape: the (rows, columns) of the floor
+        :return: a new uint8 array of the tile type codes of the floor, or None if the cache does not have it
+        """
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+
+        if data is None and self.directory is not None:
+            try:
+                with open(self.path(key), 'rb') as file:
+                    data = file.read()
+                tiles = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape)
+            except (OSError, ValueError, zlib.error):  # not there, or not a floor of this size
+                data = None
+            else:
+                with self.lock:
+                    self.disk_hits += 1
+                    self.remember(key, data)
+                return tiles.copy()
+
+        if data is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        return np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape).copy()
+
+    def put(self, key: str, tiles: np.ndarray):
+        """
+        Store a floor.
+
+        :param key: the key of the floor
+        :param tiles: the tile type codes of the floor
+        """
+        data = zlib.compress(np.ascontiguousarray(tiles, dtype=np.uint8).tobytes(), COMPRESSION)
+        with self.lock:
+            self.remember(key, data)
+
+        if self.directory is not None:
+            handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(handle, 'wb') as file:
+                    file.write(data)
+                os.replace(temporary, self.path(key))
+            except OSError:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+
+    def remember(self, key: str, data: bytes):
+        """ Keep compressed tiles in memory, dropping the least recently used floors to make room. Hold the lock. """
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        if len(data) > self.max_bytes:
+            return
+
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, dropped = self.entries.popitem(last=False)
+            self.size -= len(dropped)
+            self.evictions += 1
+
+    def clear(self):
+        """ Forget the floors kept in memory. The on-disk tier and the counters are left as they are. """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def counters(self) -> dict:
+        """
+        Get the counters of the cache.
+
+        :return: the hits, disk hits, misses and evictions, and the floors and bytes kept in memory
+        """
+        with self.lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'floors': len(self.entries), 'bytes': self.size}
@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+from functools import partial
+from itertools import repeat
+from time import perf_counter
+
+from my_global import *
+
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]  # up, down, left, right
+ENGINES = ('frontier', 'batched', 'compat')
+BUFFER_SIZE = 4096  # the number of random numbers drawn at a time by the frontier and batched engines
+WALK_LIMIT = 64  # the random walk engines give up after this many steps per grid cell without carving a tile
+PROGRESS_REPORTS = 100  # the number of times the progress of a floor is reported while it is carved
+
+# the values of the chain raster that are not chain ids
+UNCARVED = -1  # a wall that can still be carved
+OPEN = -2  # an open cell that is not the start of a chain
+OUTSIDE = -3  # the border of cells around the grid
+
+
+def random_integers(rand: np.random.Generator, high: int, size: int = BUFFER_SIZE):
+    """
+    Yield random integers from 0 to high - 1 forever, drawing them from the generator a block at a time.
+
+    :param rand: the random number generator
+    :param high: the upper limit (exclusive)
+    :param size: the number of integers drawn per block (default BUFFER_SIZE)
+    """
+    while True:
+        yield from rand.integers(high, size=size).tolist()
+
+
+def random_floats(rand: np.random.Generator, size: int = BUFFER_SIZE):
+    """
+    Yield random floats from 0.0 up to 1.0 forever, drawing them from the generator a block at a time.
+
+    :param rand: the random number generator
+    :param size: the number of floats drawn per block (default BUFFER_SIZE)
+    """
+    while True:
+        yield from rand.random(size).tolist()
+
+
+def chain_raster(open_cells: np.ndarray, starts: list) -> np.ndarray:
+    """
+    Make the raster that carving keeps the chain of every cell in. It has a border of OUTSIDE cells around the grid,
+    so the neighbors of any cell in the grid can be read without checking the bounds.
+        >>> chain_raster(np.array([[True, False, False]]), [(0, 0, (1, 0))])
+        array([[-3, -3, -3, -3, -3],
+               [-3,  0, -1, -1, -3],
+               [-3, -3, -3, -3, -3]], dtype=int32)
+
+    :param open_cells: a bool array (rows by columns) that is True for every cell that is not a wall
+    :param starts: the (row, column, direction) of the entry or staircase that starts each chain
+    :return: an int32 array (rows + 2 by columns + 2) holding the id of the chain of each cell, UNCARVED for walls,
+        OPEN for other open cells and OUTSIDE for the border
+    """
+    raster = np.full((open_cells.shape[0] + 2, open_cells.shape[1] + 2), OUTSIDE, dtype=np.int32)
+    raster[1:-1, 1:-1] = np.where(open_cells, OPEN, UNCARVED)
+    for chain_id, (row, column, direction) in enumerate(starts):
+        raster[row + 1, column + 1] = chain_id
+    return raster
+
+
+def neighbor_chains(raster: np.ndarray, rows, columns) -> np.ndarray:
+    """
+    Look up the neighbors of many cells at once.
+        >>> raster = chain_raster(np.array([[True, True, False]]), [(0, 0, (1, 0)), (0, 1, (1, 0))])
+        >>> neighbor_chains(raster, [0, 0], [0, 1])
+        array([[-3, -3, -3,  1],
+               [-3, -3,  0, -1]], dtype=int32)
+
+    :param raster: a raster made by chain_raster
+    :param rows: the rows of the cells
+    :param columns: the columns of the cells
+    :return: an int array (cells by 4) of the raster values of the neighbors of each cell, in DIRECTIONS order
+    """
+    rows = np.asarray(rows, dtype=np.intp) + 1
+    columns = np.asarray(columns, dtype=np.intp) + 1
+    return np.stack([raster[rows + r, columns + c] for c, r in DIRECTIONS], axis=-1)
+
+
+def cell_positions(indexes: list, stride: int) -> np.ndarray:
+    """
+    Turn indexes into a flattened chain raster back into grid cells.
+
+    :param indexes: the indexes
+    :param stride: the width of the raster, which is the number of grid columns + 2
+    :return: an int array (indexes by 2) of the (row, column) of each cell
+    """
+    rows, columns = np.divmod(np.array(indexes, dtype=np.intp), stride)
+    return np.stack((rows - 1, columns - 1), axis=-1).reshape(-1, 2)
+
+
+def drain(events) -> object:
+    """
+    Run a generator to its end.
+
+    :param events: the generator
+    :return: the value the generator returned
+    """
+    while True:
+        try:
+            next(events)
+        except StopIteration as stop:
+            return stop.value
+
+
+def carve_floor(open_cells: np.ndarray, starts: list, total_links: int, seed, engine: str = 'batched',
+                progress=None) -> tuple:
+    """
+    Carve the paths of one floor in one go. See carve_events for the arguments and the return value.
+    """
+    return drain(carve_events(open_cells, starts, total_links, seed, engine, progress, tiles=False))
+
+
+def carve_events(open_cells: np.ndarray, starts: list, total_links: int, seed, engine: str = 'batched',
+                 progress=None, tiles: bool = True):
+    """
+    Carve the paths of one floor. Every starting point grows a chain of floor tiles with a random walk, and chains
+    that touch are joined together, until the floor has enough tiles and every chain is joined into one.
+
+    The chain of every cell is kept in a raster (see chain_raster) that is flattened into a list, so a cell is one
+    index, a step is adding an offset to it and finding the chains next to a cell is four list lookups.
+
+    This is a generator that yields ('carve', {'row', 'column', 'chain'}) as each tile is carved and ('merge',
+    {'chain', 'other'}) as a chain is joined onto another, and returns the result once the floor is done. Carving
+    only goes on while it is asked for the next event. The events are the same for the same arguments.
+
+    The function only uses its arguments, so floors can be carved in separate processes.
+
+    :param open_cells: a bool array (rows by columns) that is True for every cell that is not a wall
+    :param starts: the (row, column, direction) of the entry or staircase that starts each chain
+    :param total_links: the number of open cells the floor should end up with
+    :param seed: the seed, or numpy SeedSequence, for the random walk of this floor
+    :param engine: 'frontier' grows each chain from cells that still have a wall next to them, so every step carves
+        a tile. 'batched' and 'compat' take random walks over the carved cells until they find a wall, which can take
+        very long on crowded floors. 'batched' takes the random numbers of the walk from blocks drawn ahead of time.
+        'compat' draws them one call at a time, which is slower but takes the same walk as before batching for the
+        same starts and seed.
+        (default 'batched')
+    :param progress: called with the number of open cells about PROGRESS_REPORTS times while the floor is carved.
+        It can raise an exception to stop carving. (default None)
+    :param tiles: False to yield no events at all, which is how carve_floor runs it (default True)
+    :return the (row, column) of each carved cell in the order they were carved, and the counters of the walk:
+        carved tiles, walk steps (moves onto a cell), rejected steps (moves that ran into the edge or an open cell and
+        turned), direction changes (random turns of a chain), merges, and the seconds spent carving and merging
+    """
+    rows, columns = open_cells.shape
+    if total_links > rows * columns:
+        raise ValueError('cannot carve %d tiles on a %d by %d grid, which only has %d cells'
+                         % (total_links, columns, rows, rows * columns))
+    if engine == 'frontier':
+        return (yield from frontier_events(open_cells, starts, total_links, seed, progress, tiles))
+
+    start = perf_counter()
+    walk_steps = rejected_steps = direction_changes = merges = 0
+    merge_seconds = 0.0
+
+    rand = np.random.default_rng(seed)
+    # the walk used to pick between the head (0) and the tail (-1) of a chain with integers(-1, 0), which always
+    # gives the tail without advancing the generator
+    end_draws = repeat(-1)
+    if engine == 'batched':
+        turn_draws = random_integers(rand, 5)
+        direction_draws = random_integers(rand, 4)
+    elif engine == 'compat':
+        turn_draws = iter(partial(rand.integers, 5), None)
+        direction_draws = iter(partial(rand.integers, 4), None)
+    else:
+        raise ValueError('engine must be one of %s, not %r' % (', '.join(ENGINES), engine))
+
+    stride = columns + 2
+    steps = [c + r * stride for c, r in DIRECTIONS]  # the index offset of each direction
+    links = chain_raster(open_cells, starts).ravel().tolist()  # the chain of each cell
+    linked = len(starts)  # the number of cells with a chain
+    carved = []  # the index of each carved cell
+    walk_limit = WALK_LIMIT * rows * columns
+
+    chain_sets = DisjointSet(len(starts))  # which chains have been joined together
+    chains = {}  # the [head, tail] (index, step) of each chain, keyed by the chain's id
+    for chain_id, (row, column, (c, r)) in enumerate(starts):
+        chains[chain_id] = [((row + 1) * stride + column + 1, c + r * stride)] * 2
+    names = {chain_id: chain_id for chain_id in chains}  # the id each joined set goes by, keyed by its root
+
+    report_every = max(1, total_links // PROGRESS_REPORTS)
+    next_report = report_every
+    while linked < total_links or chain_sets.count > 1:
+        if progress is not None and linked >= next_report:
+            progress(linked)
+            next_report = linked + report_every
+        for chain_id, ends in list(chains.items()):
+            if chain_id in chains:
+                index, step = ends[next(end_draws)]
+
+                if next(turn_draws) == 0:  # 1/n chance of changing directions
+                    step = steps[next(direction_draws)]
+                    direction_changes += 1
+
+                for _ in range(walk_limit):
+                    value = links[index + step]
+                    if value != OUTSIDE:  # not out of bounds
+                        index += step
+                        walk_steps += 1
+                        if value == UNCARVED:  # is a wall tile
+                            links[index] = chain_id
+                            linked += 1
+                            carved.append(index)
+                            ends[-1] = (index, step)
+                            if tiles:
+                                yield 'carve', {'row': index // stride - 1, 'column': index % stride - 1,
+                                                'chain': chain_id}
+
+                            for offset in steps:
+                                other = links[index + offset]
+                                if other >= 0:
+                                    root = chain_sets.find(chain_id)
+                                    other_root = chain_sets.find(other)
+                                    if other_root != root:  # join the other chain onto this one
+                                        merge_start = perf_counter()
+                                        other_id = names.pop(other_root)
+                                        ends[-1] = chains.pop(other_id)[-1]
+                                        del names[root]
+                                        names[chain_sets.union(root, other_root)] = chain_id
+                                        merges += 1
+                                        merge_seconds += perf_counter() - merge_start
+                                        if tiles:
+                                            yield 'merge', {'chain': chain_id, 'other': other_id}
+
+                            break
+                        else:
+                            step = steps[next(direction_draws)]
+                            rejected_steps += 1
+                    else:
+                        step = steps[next(direction_draws)]
+                        rejected_steps += 1
+                else:
+                    raise RuntimeError('chain %d walked %d steps without finding a wall to carve after %d of %d tiles; '
+                                       "use the 'frontier' engine for crowded floors"
+                                       % (chain_id, walk_limit, linked, total_links))
+
+    counters = {
+        'carved': len(carved),
+        'walk_steps': walk_steps,
+        'rejected_steps': rejected_steps,
+        'direction_changes': direction_changes,
+        'merges': merges,
+        'seconds': perf_counter() - start,
+        'merge_seconds': merge_seconds,
+    }
+    return cell_positions(carved, stride), counters
+
+
+def frontier_events(open_cells: np.ndarray, starts: list, total_links: int, seed, progress=None, tiles: bool = True):
+    """
+    Carve the paths of one floor like carve_events, without random walks over cells that are already carved.
+
+    Each chain keeps the carved cells it has that may still have a wall next to them. A chain goes on in its
+    direction while it can. When it runs into the edge or an open cell, it turns to a wall next to its end, and when
+    its end is closed in, it branches off from one of its other cells. Cells that turn out to be closed in are
+    dropped from the chain for good, so every step carves a tile after a bounded amount of work, and a floor is done
+    after at most one step per cell of the grid.
+
+    :param open_cells: a bool array (rows by columns) that is True for every cell that is not a wall
+    :param starts: the (row, column, direction) of the entry or staircase that starts each chain
+    :param total_links: the number of open cells the floor should end up with
+    :param seed: the seed, or numpy SeedSequence, for the random walk of this floor
+    :param progress: called with the number of open cells now and then, like in carve_events (default None)
+    :param tiles: False to yield no events, like in carve_events (default True)
+    :return the (row, column) of each carved cell in the order they were carved, and the same counters as
+        carve_events
+    """
+    start = perf_counter()
+    walk_steps = rejected_steps = direction_changes = merges = 0
+    merge_seconds = 0.0
+
+    rand = np.random.default_rng(seed)
+    turn_draws = random_integers(rand, 5)
+    direction_draws = random_integers(rand, 4)
+    picks = random_floats(rand)  # picks one of a varying number of walls or cells
+
+    rows, columns = open_cells.shape
+    stride = columns + 2
+    steps = [c + r * stride for c, r in DIRECTIONS]  # the index offset of each direction
+    raster = chain_raster(open_cells, starts)
+    links = raster.ravel().tolist()  # the chain of each cell
+    linked = len(starts)  # the number of cells with a chain
+    carved = []  # the index of each carved cell
+
+    chain_sets = DisjointSet(len(starts))  # which chains have been joined together
+    chains = {}  # the [head, tail] (index, step) of each chain, keyed by the chain's id
+    frontiers = {}  # the index of the cells each chain may still grow from, keyed by the chain's id
+    names = {}  # the id each joined set goes by, keyed by its root
+
+    def join(chain_id: int, other: int) -> int:
+        """ Join the chain of another cell onto a chain, unless they are joined already. Gives the joined id. """
+        nonlocal merges, merge_seconds
+        root = chain_sets.find(chain_id)
+        other_root = chain_sets.find(other)
+        if other_root != root:
+            merge_start = perf_counter()
+            other_id = names.pop(other_root)
+            chains[chain_id][-1] = chains.pop(other_id)[-1]
+            frontier, other_frontier = frontiers[chain_id], frontiers.pop(other_id)
+            if len(frontier) < len(other_frontier):  # copy the smaller list onto the bigger one
+                frontier, other_frontier = other_frontier, frontier
+            frontier.extend(other_frontier)
+            frontiers[chain_id] = frontier
+            del names[root]
+            names[chain_sets.union(root, other_root)] = chain_id
+            merges += 1
+            merge_seconds += perf_counter() - merge_start
+            return other_id
+
+    for chain_id, (row, column, (c, r)) in enumerate(starts):
+        index = (row + 1) * stride + column + 1
+        chains[chain_id] = [(index, c + r * stride)] * 2
+        frontiers[chain_id] = [index]
+        names[chain_id] = chain_id
+    if starts:  # starts that touch are already joined
+        start_rows, start_columns, _ = zip(*starts)
+        touching = neighbor_chains(raster, start_rows, start_columns)
+        for start, side in zip(*np.nonzero(touching >= 0)):
+            chain_id = names[chain_sets.find(int(start))]  # the start may already be joined onto another chain
+            other_id = join(chain_id, int(touching[start, side]))
+            if tiles and other_id is not None:
+                yield 'merge', {'chain': chain_id, 'other': other_id}
+
+    report_every = max(1, total_links // PROGRESS_REPORTS)
+    next_report = report_every
+    while linked < total_links or chain_sets.count > 1:
+        if progress is not None and linked >= next_report:
+            progress(linked)
+            next_report = linked + report_every
+        for chain_id in list(chains):
+            if chain_id not in chains:
+                continue
+            index, step = chains[chain_id][-1]
+
+            if next(turn_draws) == 0:  # 1/n chance of changing directions
+                step = steps[next(direction_draws)]
+                direction_changes += 1
+
+            if links[index + step] != UNCARVED:
+                options = [offset for offset in steps if links[index + offset] == UNCARVED]
+                if not options:  # the end is closed in, so branch off from another cell of the chain
+                    frontier = frontiers[chain_id]
+                    while frontier:
+                        position = int(next(picks) * len(frontier))
+                        index = frontier[position]
+                        options = [offset for offset in steps if links[index + offset] == UNCARVED]
+                        if options:
+                            break
+                        frontier[position] = frontier[-1]  # closed in for good
+                        frontier.pop()
+                    else:  # cannot happen while chains are apart or walls are left, as chains join when they touch
+                        raise RuntimeError('chain %d has no wall left to carve after %d of %d tiles'
+                                           % (chain_id, linked, total_links))
+                step = options[int(next(picks) * len(options))]
+                rejected_steps += 1
+
+            index += step
+            walk_steps += 1
+            links[index] = chain_id
+            linked += 1
+            carved.append(index)
+            chains[chain_id][-1] = (index, step)
+            frontiers[chain_id].append(index)
+            if tiles:
+                yield 'carve', {'row': index // stride - 1, 'column': index % stride - 1, 'chain': chain_id}
+
+            for offset in steps:
+                other = links[index + offset]
+                if other >= 0:
+                    other_id = join(chain_id, other)
+                    if tiles and other_id is not None:
+                        yield 'merge', {'chain': chain_id, 'other': other_id}
+
+    counters = {
+        'carved': len(carved),
+        'walk_steps': walk_steps,
+        'rejected_steps': rejected_steps,
+        'direction_changes': direction_changes,
+        'merges': merges,
+        'seconds': perf_counter() - start,
+        'merge_seconds': merge_seconds,
+    }
+    return cell_positions(carved, stride), counters
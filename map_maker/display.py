@@ -1,14 +1,26 @@
+import queue
+import threading
 from tkinter import *
+from tkinter.ttk import Progressbar
 
-from map_maker.dungeon import Dungeon
+from map_maker.cache import DungeonCache
+from map_maker.dungeon import BuildCancelled, Dungeon
+from map_maker.placement import FEATURES
+from map_maker.renderer import CanvasRenderer
+from map_maker.telemetry import BuildStats
 from my_global import *
 
+FRAME_TIME = 50  # the milliseconds between checks for tiles that changed during play and for finished builds
+
 
 class MasterDisplay:
     def __init__(self, title='Map Maker (Dungeon Master)'):
         self.window = Tk()
         self.window.title(title)
-        self.dungeon = Dungeon(self.window)
+        # only the floors that are looked at get carved, and floors seen before are not carved again. The stats are
+        # there for the progress of the builds.
+        self.dungeon = Dungeon(features=FEATURES, lazy=True, cache=DungeonCache(), stats=BuildStats())
+        self.renderer = CanvasRenderer(self.window, self.dungeon)
 
         self.seed_value = IntVar(value=self.dungeon.active_seed)
         self.random_seed = BooleanVar(value=True)
@@ -28,10 +40,20 @@ class MasterDisplay:
 
         self.current_floor = 0
 
+        # dungeons are built on a worker thread that reports back through this queue, as (build id, event, value)
+        self.build_messages = queue.Queue()
+        self.build_id = 0  # the id of the newest build; messages of older builds are ignored
+        self.build_cancel = None  # the event that stops the newest build
+        self.build_progress = DoubleVar(value=0)
+        # floors that a lazy build left for later are carved on a worker thread too, one at a time
+        self.floor_id = 0  # the id of the newest floor carving; its messages come as (('floor', id), event, value)
+        self.floor_cancel = None  # the event that stops the newest floor carving
+        self.floor_thread = None  # the thread of the newest floor carving
+
         self.create_side_bar()
-        self.map: Canvas = self.dungeon.draw(0)
-        self.generate_map()
+        self.map: Canvas = self.renderer.draw(0)
         self.map.grid(sticky=NW, row=0, column=2)
+        self.refresh_map()
 
     def create_side_bar(self):
         container_padding = 5
@@ -211,6 +233,13 @@ class MasterDisplay:
         def make_button():
             Button(side_bar, text='GENERATE MAP', command=self.generate_map).grid(sticky=E, row=15)
 
+            # build progress
+            progress_container = Frame(side_bar, pady=container_padding)
+            Progressbar(progress_container, maximum=1.0, variable=self.build_progress).grid(sticky=W, row=0, column=0)
+            self.cancel_button = Button(progress_container, text='Cancel', state=DISABLED, command=self.cancel_build)
+            self.cancel_button.grid(sticky=E, row=0, column=1)
+            progress_container.grid(sticky=E, row=16)
+
         make_seed()
         make_size()
         make_floors()
@@ -233,15 +262,15 @@ class MasterDisplay:
         floor_toggle_container.grid(sticky=NW, row=0, column=1)
 
     def generate_map(self):
-        self.current_floor = 0
-        if self.random_seed.get():
-            seed = self.dungeon.set_seed(-1)
-            self.seed_value.set(seed)
-        else:
-            self.dungeon.set_seed(self.seed_value.get())
+        """
+        Start building a new dungeon from the settings in the side bar. The dungeon is built on a worker thread and
+        shown once it is done, so the window keeps responding. Starting a new build cancels the one before it.
+        """
+        settings = self.dungeon.settings()
+        settings['seed'] = -1 if self.random_seed.get() else self.seed_value.get()
 
         if self.dynamic_size.get():
-            self.dungeon.set_size(**{
+            settings.update({
                 'grid_columns': self.grid_columns.get(),
                 'grid_rows': self.grid_rows.get(),
                 'canvas_width': -1,
@@ -249,31 +278,186 @@ class MasterDisplay:
                 'cell_size': self.cell_size.get(),
                 'padding': self.padding.get()
             })
-            self.padding.set(self.dungeon.padding)
         else:
-            self.dungeon.set_size(**{
+            settings.update({
                 'canvas_width': self.canvas_width.get(),
                 'canvas_height': self.canvas_height.get(),
                 'cell_size': self.cell_size.get()
             })
-        self.canvas_width.set(self.dungeon.canvas_size.width)
-        self.canvas_height.set(self.dungeon.canvas_size.height)
-        self.grid_columns.set(self.dungeon.grid_size.columns)
-        self.grid_rows.set(self.dungeon.grid_size.rows)
-        self.cell_size.set(self.dungeon.cell_size)
-
-        fn = ["", ""]
-        if not self.random_top.get():
-            fn[0] = self.top_floor.get()
-        if not self.random_bottom.get():
-            fn[1] = self.bottom_floor.get()
-        fn = self.dungeon.set_floors(*fn)
-        self.top_floor.set(fn[0])
-        self.bottom_floor.set(fn[1])
 
-        self.change_floor(to=0)
+        settings['top_floor'] = "" if self.random_top.get() else self.top_floor.get()
+        settings['bottom_floor'] = "" if self.random_bottom.get() else self.bottom_floor.get()
+        dungeon = Dungeon(**settings, lazy=self.dungeon.lazy, cache=self.dungeon.cache, stats=BuildStats())
 
-        self.draw_map()
+        self.seed_value.set(dungeon.active_seed)
+        self.canvas_width.set(dungeon.canvas_size.width)
+        self.canvas_height.set(dungeon.canvas_size.height)
+        self.grid_columns.set(dungeon.grid_size.columns)
+        self.grid_rows.set(dungeon.grid_size.rows)
+        self.cell_size.set(dungeon.cell_size)
+        if self.dynamic_size.get():
+            self.padding.set(dungeon.padding)
+        self.top_floor.set(dungeon.top_floor)
+        self.bottom_floor.set(dungeon.bottom_floor)
+
+        self.cancel_build()
+        self.build_id += 1
+        self.build_cancel = threading.Event()
+        self.build_progress.set(0)
+        self.cancel_button.config(state=NORMAL)
+        threading.Thread(target=self.build_dungeon, args=(self.build_id, dungeon, self.build_cancel),
+                         daemon=True).start()
+
+    def build_dungeon(self, build_id: int, dungeon: Dungeon, cancel: threading.Event):
+        """
+        Build a dungeon on the worker thread. Nothing here touches tkinter; the outcome is put on the message queue
+        for check_builds() to pick up on the main thread.
+
+        :param build_id: the id of the build
+        :param dungeon: the dungeon to build
+        :param cancel: the event that stops the build
+        """
+        def report(event, data):
+            if event == 'progress':
+                self.build_messages.put((build_id, 'progress', data['done']))
+
+        dungeon.stats.subscribe(report)
+        try:
+            dungeon.build(cancel=cancel)
+            dungeon.get_floor(0, cancel=cancel)  # carve the floor that is shown first here, not on the main thread
+        except BuildCancelled:
+            self.build_messages.put((build_id, 'cancelled', None))
+        except Exception as error:
+            self.build_messages.put((build_id, 'failed', error))
+        else:
+            self.build_messages.put((build_id, 'done', dungeon))
+        finally:
+            dungeon.stats.unsubscribe(report)
+
+    def carve_floor(self, floor_number: int):
+        """
+        Start carving a floor of the dungeon on show that a lazy build left for later. The floor is carved on a worker
+        thread and drawn once it is done, if it is still the one on show. Starting a new carving cancels the one before
+        it.
+
+        :param floor_number: the number of the floor
+        """
+        self.stop_floor()
+        self.floor_id += 1
+        self.floor_cancel = threading.Event()
+        if self.build_cancel is None:
+            self.build_progress.set(0)
+        self.cancel_button.config(state=NORMAL)
+        self.floor_thread = threading.Thread(target=self.build_floor, daemon=True, args=(
+            self.floor_id, self.dungeon, floor_number, self.floor_cancel, self.floor_thread))
+        self.floor_thread.start()
+
+    def build_floor(self, floor_id: int, dungeon: Dungeon, floor_number: int, cancel: threading.Event,
+                    previous: threading.Thread = None):
+        """
+        Carve a floor on the worker thread, like build_dungeon() builds a dungeon.
+
+        :param floor_id: the id of the carving
+        :param dungeon: the dungeon of the floor
+        :param floor_number: the number of the floor
+        :param cancel: the event that stops the carving
+        :param previous: the thread of the carving before, which is waited for so two never change a dungeon at once
+            (default None)
+        """
+        key = ('floor', floor_id)
+
+        def report(event, data):
+            if event == 'progress':
+                self.build_messages.put((key, 'progress', data['done']))
+
+        if previous is not None:
+            previous.join()
+        dungeon.stats.subscribe(report)
+        try:
+            dungeon.get_floor(floor_number, cancel=cancel)
+        except BuildCancelled:
+            self.build_messages.put((key, 'cancelled', None))
+        except Exception as error:
+            self.build_messages.put((key, 'failed', error))
+        else:
+            self.build_messages.put((key, 'done', (dungeon, floor_number)))
+        finally:
+            dungeon.stats.unsubscribe(report)
+
+    def stop_floor(self):
+        """ Stop the floor carving that is running, if there is one. """
+        if self.floor_cancel is not None:
+            self.floor_cancel.set()
+            self.floor_cancel = None
+
+    def cancel_build(self):
+        """ Stop the build and the floor carving that are running, if there are any. """
+        if self.build_cancel is not None:
+            self.build_cancel.set()
+            self.build_cancel = None
+        self.stop_floor()
+        self.cancel_button.config(state=DISABLED)
+
+    def check_builds(self):
+        """ Handle the messages the worker threads sent since the last frame. Messages of old builds are dropped. """
+        while True:
+            try:
+                build_id, event, value = self.build_messages.get_nowait()
+            except queue.Empty:
+                return
+            if build_id == ('floor', self.floor_id):
+                self.check_floor(event, value)
+                continue
+            if build_id != self.build_id:
+                continue
+
+            if event == 'progress':
+                self.build_progress.set(value)
+            else:
+                self.build_cancel = None
+                if self.floor_cancel is None:
+                    self.cancel_button.config(state=DISABLED)
+                self.build_progress.set(1 if event == 'done' else 0)
+                if event == 'done':
+                    self.show_dungeon(value)
+                elif event == 'failed':
+                    raise value
+
+    def check_floor(self, event: str, value):
+        """
+        Handle a message of the newest floor carving.
+
+        :param event: 'progress', 'done', 'cancelled' or 'failed'
+        :param value: the share of the floor carved, the dungeon and number of the floor, None or the error
+        """
+        building = self.build_cancel is not None  # a dungeon build has the progress bar while it runs
+        if event == 'progress':
+            if not building:
+                self.build_progress.set(value)
+            return
+
+        self.floor_cancel = None
+        if not building:
+            self.cancel_button.config(state=DISABLED)
+            self.build_progress.set(1 if event == 'done' else 0)
+        if event == 'done':
+            dungeon, floor_number = value
+            if dungeon is self.dungeon and floor_number == self.current_floor:
+                self.draw_map()
+        elif event == 'failed':
+            raise value
+
+    def show_dungeon(self, dungeon: Dungeon):
+        """
+        Show a dungeon that was built, from the ground floor.
+
+        :param dungeon: the built dungeon
+        """
+        self.stop_floor()
+        self.dungeon = dungeon
+        self.renderer.dungeon = dungeon
+        self.renderer.invalidate()
+        self.change_floor(to=0)
 
     def increment_floor(self):
         if self.current_floor < self.dungeon.top_floor:
@@ -288,7 +472,10 @@ class MasterDisplay:
             self.current_floor += by
         else:
             self.current_floor = to
-        self.draw_map()
+        if self.current_floor in self.dungeon.pending:
+            self.carve_floor(self.current_floor)  # drawn once it is carved, so the window keeps responding
+        else:
+            self.draw_map()
         self.floor_number_label.config(text=self.current_floor)
         if self.current_floor == self.dungeon.top_floor:
             self.increment_floor_button.config(state=DISABLED, text='r')
@@ -301,7 +488,16 @@ class MasterDisplay:
             self.decrement_floor_button.config(state=NORMAL, text='q')
 
     def draw_map(self):
-        self.map = self.dungeon.draw(self.current_floor)
+        self.map = self.renderer.draw(self.current_floor)
+
+    def refresh_map(self):
+        """
+        Paint the tiles that changed since the last frame and pick up finished builds, then check again on the next
+        frame.
+        """
+        self.window.after(FRAME_TIME, self.refresh_map)
+        self.check_builds()
+        self.renderer.refresh()
 
     def show(self):
         self.window.mainloop()
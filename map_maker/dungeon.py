@@ -1,10 +1,29 @@
 from __future__ import annotations
 
-from tkinter import *
-
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import TYPE_CHECKING
+
+from map_maker import analysis
+from map_maker.carving import DIRECTIONS, ENGINES, carve_events, carve_floor, drain
+from map_maker.placement import (PLACES, around, cell_places, choose_cells, normal_weights, reach, removable,
+                                 spread_out)
+from map_maker.telemetry import BuildStats
 from my_global import *
 
-DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]  # up, down, left, right
+if TYPE_CHECKING:
+    from tkinter import Canvas
+
+    from map_maker.cache import DungeonCache
+
+# tile type codes stored in each floor's tile array
+WALL, FLOOR, CRACKED_WALL, CRACKED_FLOOR, PIT, ENTRY, STAIRCASE_UP, STAIRCASE_DOWN, TREASURE = range(9)
+
+
+class BuildCancelled(Exception):
+    """ Raised by Dungeon.build when it is asked to stop before the maps are done. """
 
 
 class Dungeon:
@@ -15,41 +34,47 @@ class Dungeon:
 
     built = False
 
-    rand = np.random
+    rand: np.random.Generator = None
     seed = None
     active_seed = None
 
     grid_columns = None
     grid_rows = None
-    grid_size = GridSize
+    grid_size: GridSize = None
     canvas_width = None
     canvas_height = None
-    canvas_size = CanvasSize
+    canvas_size: CanvasSize = None
     cell_size = None
     padding = None
-    padding_size = PaddingSize
+    padding_size: PaddingSize = None
 
     top_floor = 0
     bottom_floor = 0
-    floors = {}
+    floors: dict = None
 
     tile_count = 0
     tile_percent = 0
 
-    chains = {}
-    links = {}
+    engine = 'frontier'
+    features: dict = None
+    lazy = False
 
-    def __init__(self, window=None,
+    chains: dict = None
+    pending: set = None
+    cache: DungeonCache = None
+    stats: BuildStats = None
+
+    def __init__(self,
                  grid_columns: int = 50, grid_rows: int = 35,
                  canvas_width: int = -1, canvas_height: int = -1,
                  cell_size: int = 25, padding: int = 15,
                  top_floor: int = "", bottom_floor: int = "",
                  tile_count: int = 0, tile_percent: float = 0.2,
-                 seed: int = -1, ):
+                 seed: int = -1, engine: str = 'frontier', features: dict = None, lazy: bool = False,
+                 cache: DungeonCache = None, stats: BuildStats = None):
         """
         Create a new dungeon.
 
-        :param window: the tkinter window that the dungeon will be displayed in.
         :param grid_columns: the number of columns for the grid that the map will be on. Must be at minimum 6 cells.
             Will be ignored if pixel_width is not -1. (default 50 columns)
         :param grid_rows: the number of rows for the grid that the map will be on. Must be at minimum 6 cells. Will be
@@ -75,18 +100,42 @@ class Dungeon:
             ignored. Must be between 0.0 (0%) and 1.0 (100%). (default 0.2 (20%))
         :param seed: the seed to be used. Use -1 or "" to set the seed to
             random. Otherwise, seed needs to be between 0 and 2,147,483,647. (default -1)
+        :param engine: how the floors are carved. 'frontier' always carves from cells that still have a wall next to
+            them, so it finishes quickly however much of the grid is used. 'batched' and 'compat' are the older
+            random walks, which can take very long above about half of the grid. 'compat' takes the walk the carver
+            took before batching, from the same entries and staircases. It does not give the maps older versions
+            gave for a seed, since the entries and staircases are placed differently now. (default 'frontier')
+        :param features: the rules for placing treasure, pits, cracked walls and cracked floors on each floor once it
+            is carved, such as placement.FEATURES, keyed by feature name. Use None to place none. (default None)
+        :param lazy: True to carve each floor only when it is first asked for with get_floor. The entries and
+            staircases of every floor are still placed up front, and a floor comes out the same whenever it is
+            carved. (default False)
+        :param cache: a DungeonCache to take carved floors from and to store them in. Use None to always carve.
+            (default None)
+        :param stats: a BuildStats to measure the builds in and to send 'progress' events to its listeners. Use None
+            to build without timing or keeping counters. (default None)
         """
-        self.window: Tk = window
+        self.grid_size = self.GridSize()
+        self.canvas_size = self.CanvasSize()
+        self.padding_size = self.PaddingSize()
+        self.floors = {}
+        self.chains = {}
+        self.pending = set()  # the floors that are placed but not carved yet
+        self.lazy = lazy
+        self.cache = cache
+        self.stats = stats
+
         self.set_seed(seed)
         self.set_size(grid_columns, grid_rows, canvas_width, canvas_height, cell_size, padding)
         self.set_floors(top_floor, bottom_floor)
         self.set_tile_count(tile_count, tile_percent)
-
-        self.canvas: Canvas = Canvas(self.window, width=self.canvas_size.width, height=self.canvas_size.height)
+        self.set_engine(engine)
+        self.set_features(features)
 
     def set_seed(self, seed: int = None):
         """
-        Change the seed used for the random number generator for this dungeon.
+        Change the seed used for the random number generator for this dungeon. Every dungeon has a generator of its
+        own, so dungeons with the same seed and settings come out the same even when built side by side in threads.
 
         :param seed: the seed to be used. Use -1 or "" to set the seed to
             random. Otherwise, seed needs to be between 0 and 2,147,483,647. (default current seed)
@@ -96,11 +145,11 @@ class Dungeon:
             self.seed = seed
 
         if seed in (-1, ""):
-            self.active_seed = np.random.randint(MAX32)
+            self.active_seed = int(np.random.default_rng().integers(MAX32))
         else:
             self.active_seed = clamp(int(self.seed))
 
-        self.rand.seed(self.active_seed)
+        self.rand = np.random.default_rng(self.active_seed)
 
         self.built = False
         return self.active_seed
@@ -162,7 +211,7 @@ class Dungeon:
             self.padding_size.top = padding
             self.padding_size.bottom = padding
 
-        self.grid_size.area = self.grid_size.columns * self.grid_size.columns
+        self.grid_size.area = self.grid_size.columns * self.grid_size.rows
         self.canvas_size.area = self.canvas_size.height * self.canvas_size.width
         self.built = False
         return self.grid_size, self.canvas_size, self.cell_size, self.padding
@@ -208,276 +257,890 @@ class Dungeon:
         self.built = False
         return tile_count, tile_percent
 
-    def build(self):
-        """ Build the maps. """
+    def set_engine(self, engine: str = None):
+        """
+        Set how the floors are carved.
+
+        :param engine: 'frontier' always carves from cells that still have a wall next to them, so every step makes
+            progress. 'batched' is the older random walk with its random numbers drawn in blocks. 'compat' draws them
+            one at a time, which takes the walk the carver took before batching from the same entries and
+            staircases, but not the maps older versions gave for a seed. (default current engine)
+        :return the engine
+        """
+        if engine is not None:
+            if engine not in ENGINES:
+                raise ValueError('engine must be one of %s, not %r' % (', '.join(ENGINES), engine))
+            self.engine = engine
+        self.built = False
+        return self.engine
+
+    def set_features(self, features: dict = None):
+        """
+        Set the features that are placed on each floor once it is carved. A rule is a dict of:
+
+            where           the kind of cell the feature goes on, one of placement.PLACES
+            density         the most features to place, as a fraction of the walkable cells of the floor
+            min_distance    the fewest steps between a feature and the nearest entry or staircase (default 0)
+
+        The features are placed in the order of the rules, never touching each other, not even at a corner.
+        Features that cannot be walked on are only placed where taking the cell out leaves every other cell of the
+        floor reachable.
+
+        :param features: the rules, keyed by a name in FEATURE_TYPES, such as placement.FEATURES. Use an empty dict
+            to place none. (default current features)
+        :return the features
+        """
+        if features is not None:
+            for name, rule in features.items():
+                if name not in self.FEATURE_TYPES:
+                    raise ValueError('features must be among %s, not %r' % (', '.join(self.FEATURE_TYPES), name))
+                if rule['where'] not in PLACES:
+                    raise ValueError('the %s must go on one of %s, not %r' % (name, ', '.join(PLACES), rule['where']))
+            self.features = {name: dict(rule) for name, rule in features.items()}
+        elif self.features is None:
+            self.features = {}
+        self.built = False
+        return self.features
+
+    def build(self, workers: int = 1, cancel=None, lazy: bool = None):
+        """
+        Build the maps. Once the entries and staircases are placed, each floor is carved from a seed of its own that
+        is derived from the dungeon's seed, so the maps come out the same however many workers are used.
+
+        If the dungeon has stats, the time spent in each phase and the counters of each floor are kept in
+        self.stats, and the listeners of self.stats get a 'progress' event as the floors are carved.
+
+        :param workers: the number of processes that carve floors at the same time. Use 1 to carve the floors one
+            after another in this process, or 0 to use one process per CPU. (default 1)
+        :param cancel: a threading.Event, or anything else with an is_set() method, that stops the build with
+            BuildCancelled once it is set. It is checked while floors are carved, so it can be set from another
+            thread. The dungeon is left unbuilt. (default None)
+        :param lazy: True to only place the entries and staircases, and carve each floor when get_floor first asks
+            for it. (default self.lazy)
+        """
+        drain(self.build_events(workers, cancel, tiles=False, lazy=lazy))
+
+    def build_events(self, workers: int = 1, cancel=None, tiles: bool = True, lazy: bool = None):
+        """
+        Build the maps a step at a time. This is a generator that yields (event, data) pairs as the build goes on:
+
+            ('entry', {'floor', 'row', 'column', 'chain'})    an entry was placed
+            ('staircase', {'floor', 'row', 'column'})         a staircase up from the floor was placed
+            ('carve', {'floor', 'row', 'column', 'chain'})    a tile was carved; it is already set on the floor
+            ('merge', {'floor', 'chain', 'other'})            chain other was joined onto chain
+            ('floor', {'floor', counters...})                 the floor is done
+            ('build', {'phases', 'totals'})                   every floor is done and the dungeon is built
+
+        The build only goes on while the next event is asked for, so the maps can be drawn or animated as they are
+        carved, or the build can be dropped part way, for example once it runs out of time. Going through every
+        event builds exactly the same dungeon as build(), and a dropped build does not change what the next build
+        makes.
+
+            for event, data in dungeon.build_events():
+                if event == 'carve':
+                    ...
+
+        :param workers: the number of processes that carve floors at the same time, like in build(). With more than
+            one, there are no 'carve' and 'merge' events and the floors are done in whole. (default 1)
+        :param cancel: an event that stops the build with BuildCancelled, like in build() (default None)
+        :param tiles: False to leave out the 'carve' and 'merge' events (default True)
+        :param lazy: True to stop once the entries and staircases are placed, like in build(). There are no
+            'carve', 'merge' and 'floor' events then. (default self.lazy)
+        """
+        stats = self.stats
+        if stats is not None:
+            stats.reset()
+        self.built = False
+        self.pending.clear()
+
+        def check_cancel():
+            if cancel is not None and cancel.is_set():
+                raise BuildCancelled('the build of dungeon %d was cancelled' % self.active_seed)
+
         self.floors.clear()
         self.chains.clear()
-        self.links.clear()
+        # start the seed's stream over, so every build places the entries and staircases where a new dungeon with the
+        # same settings would, even after an earlier build or one that was dropped part way. The carving of each floor
+        # only fits the entries and staircases it was carved from, so the floors in self.cache rely on this too.
+        self.rand = np.random.default_rng(self.active_seed)
 
         for floor_number in range(self.bottom_floor, self.top_floor + 1):
             self.floors[floor_number] = self.Floor(self, floor_number)
-            self.chains[floor_number] = {}
-            self.links[floor_number] = {}
-
-        for _ in range(abs(round(self.rand.normal(0, 1))) + 1):  # create a random number of entries
-            while True:
-                wall = DIRECTIONS[self.rand.randint(4)]
-                column, row = wall
-
-                if column == 0:
-                    size = self.grid_size.columns - 1
-                    mean = size / 2
-                    sd = mean / 3
-                    column = clamp(round(self.rand.normal(mean, sd)), 2, size - 2)
-                    row = int((row + 1) / 2) * (self.grid_size.rows - 1)
+            self.chains[floor_number] = []  # the link each chain starts from, in chain id order
+
+        with self.phase('entries'):
+            ground = self.floors[0]
+            count = abs(round(self.rand.normal(0, 1))) + 1  # create a random number of entries
+            for row, column in choose_cells(self.rand, self.entry_weights() * (ground.tiles == WALL), count).tolist():
+                chain_id = len(self.chains[0])
+                if row == 0 or row == self.grid_size.rows - 1:  # on the top or bottom wall
+                    direction = [0, 1 if row == 0 else -1]
                 else:
-                    size = self.grid_size.rows - 1
-                    mean = size / 2
-                    sd = mean / 3
-                    row = clamp(round(self.rand.normal(mean, sd)), 2, size - 2)
-                    column = int((column + 1) / 2) * (self.grid_size.columns - 1)
-
-                if self.floors[0].grid[row][column].name == 'wall':
-                    chain: list = []
-                    chain_id = len(self.chains[0])
-                    direction = [w * -1 for w in wall]
-                    etw = Dungeon.EntryTile(self, self.floors[0], row, column, direction)
-                    self.floors[0].grid[row][column] = etw
-                    last_link = Dungeon.Link(etw, chain_id, direction)
-                    chain.append(last_link)
-                    self.chains[0][chain_id] = chain
-                    self.links[0][column, row] = last_link
-                    break
-
-        c_total = self.grid_size.columns - 1
-        c_mean = c_total / 2
-        c_sd = c_mean / 3
-        r_total = self.grid_size.rows - 1
-        r_mean = r_total / 2
-        r_sd = r_mean / 3
-
+                    direction = [1 if column == 0 else -1, 0]
+                ground.set_tile(Dungeon.EntryTile(self, ground, row, column, direction))
+                self.chains[0].append(Dungeon.Link(ground, row, column, chain_id, direction))
+        for link in self.chains[0]:
+            yield 'entry', {'floor': 0, 'row': link.row, 'column': link.column, 'chain': link.chain_id}
+
+        with self.phase('staircases'):
+            weights = self.staircase_weights()
+            for floor_number in range(self.bottom_floor, self.top_floor):
+                floor = self.floors[floor_number]
+                next_floor = self.floors[floor_number + 1]
+                count = abs(round(self.rand.normal(0, 1))) + 1  # create a random number of staircases
+                cells = choose_cells(self.rand, weights * ((floor.tiles == WALL) & (next_floor.tiles == WALL)), count)
+                if len(cells) == 0:
+                    raise ValueError('there is no room left for a staircase between floors %d and %d'
+                                     % (floor_number, floor_number + 1))
+
+                floor.tiles[cells[:, 0], cells[:, 1]] = STAIRCASE_UP
+                next_floor.tiles[cells[:, 0], cells[:, 1]] = STAIRCASE_DOWN
+                directions = self.rand.integers(4, size=(len(cells), 2)).tolist()
+                for (row, column), (up, down) in zip(cells.tolist(), directions):
+                    self.chains[floor_number].append(Dungeon.Link(floor, row, column, len(self.chains[floor_number]),
+                                                                  DIRECTIONS[up]))
+                    self.chains[floor_number + 1].append(Dungeon.Link(next_floor, row, column,
+                                                                      len(self.chains[floor_number + 1]),
+                                                                      DIRECTIONS[down]))
         for floor_number in range(self.bottom_floor, self.top_floor):
-            next_floor = floor_number + 1
-            for _ in range(abs(round(self.rand.normal(0, 1))) + 1):  # create a random number of staircases
-                while True:
-                    column = clamp(int(self.rand.normal(c_mean, c_sd)), 1, c_total - 1)
-                    row = clamp(int(self.rand.normal(r_mean, r_sd)), 1, r_total - 1)
-
-                    if self.floors[floor_number].grid[row][column].name == 'wall':
-                        chain1: list = []
-                        chain_id1 = len(self.chains[floor_number])
-                        scu = Dungeon.StaircaseUpTile(self, self.floors[floor_number], row, column)
-                        self.floors[floor_number].grid[row][column] = scu
-                        link1 = Dungeon.Link(scu, chain_id1, DIRECTIONS[self.rand.randint(4)])
-                        chain1.append(link1)
-                        self.chains[floor_number][chain_id1] = chain1
-                        self.links[floor_number][column, row] = link1
-
-                        chain2: list = []
-                        chain_id2 = len(self.chains[next_floor])
-                        scd = Dungeon.StaircaseDownTile(self, self.floors[next_floor], row, column)
-                        self.floors[next_floor].grid[row][column] = scd
-                        link2 = Dungeon.Link(scd, chain_id2, DIRECTIONS[self.rand.randint(4)])
-                        chain2.append(link2)
-                        self.chains[next_floor][chain_id2] = chain2
-                        self.links[next_floor][column, row] = link2
-                        break
-
-        if self.tile_count == 0:
-            total_links = round(self.grid_size.area * self.tile_percent)
-        else:
-            total_links = clamp(self.tile_count if self.tile_count > 0 else self.grid_size.area + self.tile_count, 0,
-                                self.grid_size.area)
-
-        for floor_number, chains in self.chains.items():
-            while len(self.links[floor_number]) < total_links or len(chains) > 1:
-                for chain_id, chain in list(chains.items()):
-                    if chain_id in chains:
-                        last_link = chain[self.rand.randint(-1, 0)]
-                        column = last_link.column
-                        row = last_link.row
-
-                        if self.rand.randint(5) == 0:  # 1/n chance of changing directions
-                            direction = DIRECTIONS[self.rand.randint(4)]
-                        else:
-                            direction = last_link.direction
-
-                        while True:
-                            if 0 <= column + direction[0] < self.grid_size.columns and \
-                                    0 <= row + direction[1] < self.grid_size.rows:  # not out of bounds
-                                column = column + direction[0]
-                                row = row + direction[1]
-                                if self.floors[floor_number].grid[row][column].name == 'wall':  # is a wall tile
-                                    flt = Dungeon.FloorTile(self, self.floors[0], row, column)
-                                    self.floors[floor_number].grid[row][column] = flt
-                                    link = Dungeon.Link(flt, chain_id, direction)
-                                    chain.append(link)
-                                    self.links[floor_number][column, row] = link
-
-                                    for c, r in DIRECTIONS:
-                                        key = (column + c, row + r)
-                                        if key in self.links[floor_number]:
-                                            other: Dungeon.Link = self.links[floor_number][key]
-                                            if other.tile.name != 'wall' and other.chain_id != chain_id:
-                                                for other in self.chains[floor_number].pop(other.chain_id):
-                                                    other.chain_id = chain_id
-                                                    self.chains[floor_number][chain_id].append(other)
-
-                                    break
-                                else:
-                                    direction = DIRECTIONS[self.rand.randint(4)]
+            for row, column in np.argwhere(self.floors[floor_number].tiles == STAIRCASE_UP).tolist():
+                yield 'staircase', {'floor': floor_number, 'row': row, 'column': column}
+
+        if self.lazy if lazy is None else lazy:
+            self.pending.update(self.floors)
+            self.built = True
+            yield 'build', self.finish_stats()
+            return
+
+        check_cancel()
+        total_links = self.total_links()
+        goal = max(1, total_links * len(self.floors))  # the open cells of every floor together
+        finished = 0  # the open cells of the floors that are done
+
+        def report(floor_number: int, linked: int):
+            check_cancel()
+            if stats is not None:
+                stats.publish('progress', {'floor': floor_number, 'tiles': linked, 'total': total_links,
+                                           'done': min(1.0, (finished + min(linked, total_links)) / goal)})
+
+        with self.phase('carving'):
+            if workers == 1:
+                for floor_number in self.floors:
+                    counters = yield from self.floor_events(floor_number, total_links, partial(report, floor_number),
+                                                            tiles)
+                    finished += total_links
+                    report(floor_number, total_links)
+                    yield 'floor', {'floor': floor_number, **counters}
+            else:
+                with ProcessPoolExecutor(workers or None) as executor:
+                    futures = {floor_number: None if self.cached_floor(floor_number) else
+                               executor.submit(carve_floor, *self.carve_arguments(floor_number, total_links))
+                               for floor_number in self.floors}
+                    try:
+                        for floor_number, future in futures.items():
+                            if future is None:
+                                counters = {'cached': 1}
                             else:
-                                direction = DIRECTIONS[self.rand.randint(4)]
+                                cells, counters = future.result()
+                                self.carve(floor_number, cells, counters)
+                                self.cache_floor(floor_number)
+                            self.place_features(floor_number)
+                            finished += total_links
+                            report(floor_number, total_links)
+                            yield 'floor', {'floor': floor_number, **counters}
+                    except (BuildCancelled, GeneratorExit):  # cancelled or dropped
+                        executor.shutdown(cancel_futures=True)  # do not wait for the floors that have not started
+                        raise
+
+        if stats is not None:  # the time the carvers spent walking and merging chains, added up over the floors
+            stats.add_phase('walk', sum(*[floor.get('seconds', 0) - floor.get('merge_seconds', 0)
+                                          for floor in stats.floors.values()]))
+            stats.add_phase('merge', sum(*[floor.get('merge_seconds', 0) for floor in stats.floors.values()]))
 
         self.built = True
+        yield 'build', self.finish_stats()
+
+    def phase(self, name: str):
+        """
+        Time the code in a with block as a phase of the build in self.stats. Without stats, nothing is timed.
+
+        :param name: the name of the phase
+        :return the context manager
+        """
+        return nullcontext() if self.stats is None else self.stats.phase(name)
+
+    def finish_stats(self) -> dict:
+        """
+        Tell the listeners of self.stats that the build is done.
+
+        :return the data of the 'build' event: the phases and the totals, which are empty without stats
+        """
+        if self.stats is None:
+            return {'phases': {}, 'totals': {}}
+        self.stats.finish()
+        return {'phases': dict(self.stats.phases), 'totals': self.stats.totals}
+
+    def total_links(self) -> int:
+        """
+        Get the number of open tiles each floor is carved to.
+
+        :return the target number of tiles per floor
+        """
+        if self.tile_count == 0:
+            return round(self.grid_size.area * self.tile_percent)
+        return clamp(self.tile_count if self.tile_count > 0 else self.grid_size.area + self.tile_count, 0,
+                     self.grid_size.area)
+
+    def entry_weights(self) -> np.ndarray:
+        """
+        Get the chance of each cell to be picked for an entry. Entries are on one of the four outer walls, picked
+        evenly, and towards the middle of that wall, with a standard deviation of a sixth of its length. They stay
+        two cells away from the corners.
+
+        :return a float array (rows by columns) that is 0 away from the outer walls
+        """
+        rows, columns = self.grid_size.rows, self.grid_size.columns
+        weights = np.zeros((rows, columns))
+        across = normal_weights(2, columns - 3, (columns - 1) / 2, (columns - 1) / 6) / 4
+        down = normal_weights(2, rows - 3, (rows - 1) / 2, (rows - 1) / 6) / 4
+        weights[[0, -1], 2:columns - 2] = across
+        weights[2:rows - 2, [0, -1]] = down[:, np.newaxis]
+        return weights
+
+    def staircase_weights(self) -> np.ndarray:
+        """
+        Get the chance of each cell to be picked for a staircase. Staircases are towards the middle of the map, with a
+        standard deviation of a sixth of its width and height. They stay off the outer walls.
+
+        :return a float array (rows by columns) that is 0 on the outer walls
+        """
+        rows, columns = self.grid_size.rows, self.grid_size.columns
+        weights = np.zeros((rows, columns))
+        across = normal_weights(1, columns - 2, (columns - 1) / 2, (columns - 1) / 6, truncate=True)
+        down = normal_weights(1, rows - 2, (rows - 1) / 2, (rows - 1) / 6, truncate=True)
+        weights[1:rows - 1, 1:columns - 1] = np.outer(down, across)
+        return weights
+
+    def floor_seed(self, floor_number: int) -> np.random.SeedSequence:
+        """
+        Get the seed the random walk of a floor is carved from. This is the child that
+        SeedSequence(active_seed).spawn() gives for the floor's place counting up from the bottom floor.
+
+        :param floor_number: the number of the floor
+        :return the seed of the floor
+        """
+        return np.random.SeedSequence(self.active_seed, spawn_key=(floor_number - self.bottom_floor,))
+
+    def carve_arguments(self, floor_number: int, total_links: int) -> tuple:
+        """
+        Get the arguments that carve_floor needs to carve a floor.
+
+        :param floor_number: the number of the floor
+        :param total_links: the number of open tiles the floor should end up with
+        :return the open cells, the chain starts, the total links, the seed of the floor and the engine
+        """
+        starts = [(link.row, link.column, link.direction) for link in self.chains[floor_number]]
+        return (self.floors[floor_number].tiles != WALL, starts, total_links, self.floor_seed(floor_number),
+                self.engine)
+
+    def carve(self, floor_number: int, cells: np.ndarray, counters: dict = None):
+        """
+        Turn the carved cells of a floor into floor tiles.
+
+        :param floor_number: the number of the floor
+        :param cells: the (row, column) of each carved cell
+        :param counters: the counters carve_floor gave for the floor, to be kept in self.stats if the dungeon has
+            stats (default None)
+        """
+        self.floors[floor_number].tiles[cells[:, 0], cells[:, 1]] = FLOOR
+        if counters is not None and self.stats is not None:
+            self.stats.add_floor(floor_number, counters)
+
+    def floor_events(self, floor_number: int, total_links: int, progress=None, tiles: bool = True):
+        """
+        Carve a floor, setting each tile on the floor as it is carved. This is a generator that yields the 'carve' and
+        'merge' events of build_events. A floor that is found in self.cache is taken from there without any events.
+
+        :param floor_number: the number of the floor
+        :param total_links: the number of open tiles the floor should end up with
+        :param progress: called with the number of open cells now and then, like in carve_floor (default None)
+        :param tiles: False to yield no events (default True)
+        :return the counters of the floor, which are just {'cached': 1} for a floor from the cache
+        """
+        if self.cached_floor(floor_number):
+            self.place_features(floor_number)
+            return {'cached': 1}
+
+        tile_array = self.floors[floor_number].tiles
+        events = carve_events(*self.carve_arguments(floor_number, total_links), progress=progress, tiles=tiles)
+        while True:
+            try:
+                event, data = next(events)
+            except StopIteration as stop:
+                cells, counters = stop.value
+                break
+            if event == 'carve':
+                tile_array[data['row'], data['column']] = FLOOR
+            data['floor'] = floor_number
+            yield event, data
+
+        self.carve(floor_number, cells, counters)
+        self.cache_floor(floor_number)
+        self.place_features(floor_number)
+        self.pending.discard(floor_number)
+        return counters
+
+    def cached_floor(self, floor_number: int) -> bool:
+        """
+        Set the tiles of a floor that is only placed from self.cache, if the cache has it.
+
+        :param floor_number: the number of the floor
+        :return True if the floor was found
+        """
+        if self.cache is None:
+            return False
+
+        floor = self.floors[floor_number]
+        tiles = self.cache.get(self.cache.key(self, floor_number), floor.tiles.shape)
+        if tiles is None:
+            return False
+
+        floor.tiles[:] = tiles
+        self.pending.discard(floor_number)
+        if self.stats is not None:
+            self.stats.add_floor(floor_number, {'cached': 1})
+        return True
+
+    def cache_floor(self, floor_number: int):
+        """
+        Store a floor that was just carved in self.cache, if the dungeon has one.
+
+        :param floor_number: the number of the floor
+        """
+        if self.cache is not None:
+            self.cache.put(self.cache.key(self, floor_number), self.floors[floor_number].tiles)
 
-    def draw(self, floor_number: int = 0) -> Canvas:
+    def place_features(self, floor_number: int):
         """
-        Build and draw the different layers of the map.
+        Place the features of self.features on a floor that was just carved. The cells are drawn from a seed of the
+        floor's own, the first child of its carving seed, so the features come out the same whether the floor was
+        carved, taken from the cache or carved lazily. Only the carving is cached; the features are placed every time.
 
-        :param floor_number: the number of the floor that will be drawn
-        :return the map as a set of tkinter canvases
+        :param floor_number: the number of the floor
         """
+        if not self.features:
+            return
+
+        with self.phase('features'):
+            floor = self.floors[floor_number]
+            rand = np.random.default_rng(self.floor_seed(floor_number).spawn(1)[0])
+            walkable = floor.walkable()
+            places = cell_places(floor.tiles == FLOOR, floor.tiles == WALL, walkable)
+            steps = reach(floor.distances())
+            safe = removable(walkable)
+            taken = np.zeros(floor.tiles.shape, dtype=bool)  # the features placed so far and the cells touching them
+            count = np.count_nonzero(walkable)
+
+            for name, rule in self.features.items():
+                tile_type = self.FEATURE_TYPES[name]
+                candidates = places[rule['where']] & ~taken & (steps >= rule.get('min_distance', 0))
+                if not tile_type.default_walkable:  # only where walking around it is still possible
+                    candidates &= safe | ~walkable
+                cells = choose_cells(rand, spread_out(rand, candidates), round(count * rule['density']))
+
+                floor.tiles[cells[:, 0], cells[:, 1]] = tile_type.code
+                if tile_type.stateful:
+                    for row, column in cells.tolist():
+                        floor.stateful[row, column] = tile_type(self, floor, row, column)
+                taken |= around(cells, taken.shape)
+
+    def build_floor(self, floor_number: int, cancel=None, progress=None) -> Dungeon.Floor:
+        """
+        Carve a floor that a lazy build left for later. Floors that are already carved are left as they are.
+
+        If the dungeon has stats, their listeners get 'progress' events as the floor is carved, like during build(),
+        with 'done' going from 0 to 1 over this floor.
+
+        :param floor_number: the number of the floor
+        :param cancel: an event that stops the carving with BuildCancelled, like in build(). The floor is then left
+            for later. (default None)
+        :param progress: called with the number of open cells of the floor now and then, like in carve_floor
+            (default None)
+        :return the floor, or None if the dungeon does not have that floor
+        """
+        if floor_number in self.pending:
+            total_links = self.total_links()
+
+            def report(linked: int):
+                if cancel is not None and cancel.is_set():
+                    raise BuildCancelled('the carving of floor %d of dungeon %d was cancelled'
+                                         % (floor_number, self.active_seed))
+                if self.stats is not None:
+                    self.stats.publish('progress', {'floor': floor_number, 'tiles': linked, 'total': total_links,
+                                                    'done': min(1.0, linked / max(1, total_links))})
+                if progress is not None:
+                    progress(linked)
+
+            report(0)
+            with self.phase('carving'):
+                counters = drain(self.floor_events(floor_number, total_links, report, tiles=False))
+            report(total_links)
+            if self.stats is not None:
+                self.stats.add_phase('walk', counters.get('seconds', 0) - counters.get('merge_seconds', 0))
+                self.stats.add_phase('merge', counters.get('merge_seconds', 0))
+
+        return self.floors.get(floor_number)
+
+    def build_all(self):
+        """ Carve every floor that a lazy build left for later, building the maps first if needed. """
         if not self.built:
             self.build()
 
-        if floor_number in self.floors:
-            return self.floors[floor_number].draw(self.canvas, self.canvas_size)
+        for floor_number in sorted(self.pending):
+            self.build_floor(floor_number)
+
+    def get_floor(self, floor_number: int = 0, cancel=None, progress=None) -> Dungeon.Floor:
+        """
+        Get one of the floors of the dungeon, building the maps first if needed. On a lazy dungeon, the floor is carved
+        the first time it is asked for.
+
+        :param floor_number: the number of the floor
+        :param cancel: an event that stops the building and carving with BuildCancelled, like in build()
+            (default None)
+        :param progress: called with the number of open cells of the floor now and then while it is carved, like in
+            build_floor (default None)
+        :return the floor, or None if the dungeon does not have that floor
+        """
+        if not self.built:
+            self.build(cancel=cancel)
+
+        return self.build_floor(floor_number, cancel, progress)
+
+    def to_dict(self) -> dict:
+        """
+        Get the settings and the built floors of the dungeon as plain data that can be saved as JSON.
+
+        :return the dungeon as a dict
+        """
+        self.build_all()
+
+        return {**self.settings(), 'floors': [floor.to_dict() for floor in self.floors.values()]}
+
+    def settings(self) -> dict:
+        """
+        Get the settings that the dungeon was made with, as keyword arguments for Dungeon. A dungeon made with them
+        builds the same maps.
 
-        return self.canvas
+        :return the settings as a dict
+        """
+        return {
+            'seed': self.active_seed,
+            'grid_columns': self.grid_size.columns,
+            'grid_rows': self.grid_size.rows,
+            'canvas_width': self.canvas_width,
+            'canvas_height': self.canvas_height,
+            'cell_size': self.cell_size,
+            'padding': self.padding,
+            'top_floor': self.top_floor,
+            'bottom_floor': self.bottom_floor,
+            'tile_count': self.tile_count,
+            'tile_percent': self.tile_percent,
+            'engine': self.engine,
+            'features': self.features,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Dungeon:
+        """
+        Recreate a dungeon from the data made by to_dict without building it again.
+
+        :param data: the dungeon as a dict
+        :return the dungeon
+        """
+        dungeon = cls(**{key: value for key, value in data.items() if key != 'floors'})
+        for floor_data in data['floors']:
+            cls.Floor.from_dict(dungeon, floor_data)
+        dungeon.built = True
+        return dungeon
 
     class Floor:
-        def __init__(self, dungeon: Dungeon, floor_number: int):
+        def __init__(self, dungeon: Dungeon, floor_number: int, tiles: np.ndarray = None):
+            """
+            Create a new floor.
+
+            :param dungeon: the dungeon the floor belongs to
+            :param floor_number: the number of the floor
+            :param tiles: the tile type code of each cell, such as a loaded or memory-mapped array. (default all walls)
+            """
             self.dungeon = dungeon
             self.number = floor_number
             self.rows = range(self.dungeon.grid_size.rows)
             self.cols = range(self.dungeon.grid_size.columns)
-            self.grid = [[Dungeon.WallTile(self.dungeon, self, row, col) for col in self.cols] for row in self.rows]
+            if tiles is None:
+                tiles = np.full((len(self.rows), len(self.cols)), WALL, dtype=np.uint8)
+            self.tiles = tiles  # the tile type code of each cell
+            self.stateful = {}  # the tiles that carry their own state, keyed by (row, column)
+            self.changes = []  # the (row, column) of every tile change since the floor was made, oldest first
+            self.analysis = {}  # the results of the analysis methods, kept while the tiles stay as they were
+            self.analysis_key = None  # the version and checksum of the tiles the results in self.analysis are for
             self.padding_left = self.dungeon.padding_size.left
             self.padding_top = self.dungeon.padding_size.top
             self.cell_size = self.dungeon.cell_size
             self.dungeon.floors[self.number] = self
 
+        def tile(self, row: int, column: int) -> Dungeon.Tile:
+            """
+            Get the tile in a cell. Tiles without state are created on demand from the tile array.
+
+            :param row: the row of the cell
+            :param column: the column of the cell
+            :return the tile in that cell
+            """
+            tile = self.stateful.get((row, column))
+            if tile is None:
+                tile = Dungeon.TILE_TYPES[self.tiles[row, column]](self.dungeon, self, row, column)
+            return tile
+
+        def set_tile(self, tile: Dungeon.Tile):
+            """
+            Put a tile into its cell, replacing whatever was there.
+
+            :param tile: the tile to be placed
+            """
+            self.tiles[tile.row, tile.column] = tile.code
+            if tile.stateful:
+                self.stateful[tile.row, tile.column] = tile
+            else:
+                self.stateful.pop((tile.row, tile.column), None)
+            self.changed(tile.row, tile.column)
+
+        def changed(self, row: int, column: int):
+            """
+            Record that the tile in a cell changed state or color, so anything drawn from the floor can update just
+            that cell.
+
+            :param row: the row of the cell
+            :param column: the column of the cell
+            """
+            self.changes.append((row, column))
+
+        @property
+        def version(self) -> int:
+            """ The number of tile changes so far. It goes up every time a tile of the floor changes. """
+            return len(self.changes)
+
+        def changed_since(self, version: int) -> set:
+            """
+            Get the dirty cells: the cells whose tile changed after the floor was at a version.
+
+            :param version: the version of the floor when it was last looked at
+            :return the (row, column) of each changed cell
+            """
+            return set(self.changes[version:])
+
+        def analysed(self, name: str, compute):
+            """
+            Get a result of analysing the tiles, computing it only when the floor changed since it was last asked for.
+            Both the version and a checksum of the tile array are compared, so tiles written straight into the array,
+            as carving does, are noticed as well as tiles changed through set_tile.
+
+            :param name: the name the result is kept under
+            :param compute: called with no arguments to compute the result
+            :return the result
+            """
+            key = (self.version, zlib.crc32(np.ascontiguousarray(self.tiles)))
+            if key != self.analysis_key:
+                self.analysis = {}
+                self.analysis_key = key
+            if name not in self.analysis:
+                self.analysis[name] = compute()
+            return self.analysis[name]
+
+        def walkable(self) -> np.ndarray:
+            """
+            Get the cells that can be walked on, taking the state of stateful tiles, such as broken walls, into account.
+            The array is shared by every caller, so do not change it.
+
+            :return a bool array (rows by columns)
+            """
+            def compute():
+                walkable = Dungeon.WALKABLE[self.tiles]
+                for (row, column), tile in self.stateful.items():
+                    walkable[row, column] = tile.walkable
+                return walkable
+            return self.analysed('walkable', compute)
+
+        def sources(self) -> np.ndarray:
+            """
+            Get the cells of the entries and staircases of the floor.
+
+            :return an int array (cells by 2) of the (row, column) of each, row by row
+            """
+            return np.argwhere(np.isin(self.tiles, (ENTRY, STAIRCASE_UP, STAIRCASE_DOWN)))
+
+        def distances(self, sources: np.ndarray = None) -> np.ndarray:
+            """
+            Get the number of steps from each cell to the nearest source (see analysis.distance_field). The distances
+            from the entries and staircases are kept until the floor changes; the ones from other sources are not.
+
+            :param sources: an int array (cells by 2) of the (row, column) of each cell to measure from. Use None for
+                the entries and staircases. (default None)
+            :return an int32 array (rows by columns) of steps, or -1 for cells that cannot be reached
+            """
+            if sources is not None:
+                return analysis.distance_field(self.walkable(), sources)
+            return self.analysed('distances', lambda: analysis.distance_field(self.walkable(), self.sources()))
+
+        def components(self) -> tuple:
+            """
+            Label the groups of cells that can be walked between (see analysis.components). Kept until the floor
+            changes.
+
+            :return an int32 array (rows by columns) of the component of each cell, or -1 for cells that cannot be
+                walked on, and the number of components
+            """
+            return self.analysed('components', lambda: analysis.components(self.walkable()))
+
+        def dead_ends(self) -> np.ndarray:
+            """
+            Find the walkable cells with only one walkable neighbor. Kept until the floor changes.
+
+            :return a bool array (rows by columns) that is True at each dead end
+            """
+            return self.analysed('dead_ends', lambda: analysis.dead_ends(self.walkable()))
+
+        def is_connected(self) -> bool:
+            """ Whether every walkable cell of the floor can be reached from every other one. """
+            return self.components()[1] <= 1
+
+        def to_dict(self) -> dict:
+            """
+            Get the tiles of the floor as plain data.
+
+            :return the floor number, the tile type codes row by row, and the stateful tiles as
+                [row, column, code, *arguments]
+            """
+            return {
+                'number': self.number,
+                'tiles': self.tiles.tolist(),
+                'stateful': [[tile.row, tile.column, tile.code, *tile.arguments()] for tile in self.stateful.values()],
+            }
+
+        @classmethod
+        def from_dict(cls, dungeon: Dungeon, data: dict) -> Dungeon.Floor:
+            """
+            Recreate a floor from the data made by to_dict.
+
+            :param dungeon: the dungeon the floor belongs to
+            :param data: the floor as a dict
+            :return the floor
+            """
+            floor = cls(dungeon, data['number'], np.array(data['tiles'], dtype=np.uint8))
+            for row, column, code, *arguments in data['stateful']:
+                floor.set_tile(Dungeon.TILE_TYPES[code](dungeon, floor, row, column, *arguments))
+            return floor
+
         def draw(self, canvas: Canvas, size: Dungeon.CanvasSize) -> Canvas:
-            wall_color = Dungeon.WallTile.default_color
-            canvas.config(width=size.width, height=size.height)
-            canvas.create_rectangle(0, 0, size.width, size.height, fill=wall_color)
-
-            for row in self.grid:
-                for tile in row:
-                    if tile.name != 'wall':
-                        color = tile.color
-                        x1 = self.padding_left + self.cell_size * tile.column
-                        y1 = self.padding_top + self.cell_size * tile.row
-                        x2 = x1 + self.cell_size
-                        y2 = y1 + self.cell_size
-                        tile.draw(canvas, x1, y1, x2, y2)
+            """
+            Draw the whole floor onto a canvas, on top of whatever is on it. This paints a FloorLayer of the renderer
+            once and keeps nothing, so drawing the floor again adds a new set of items; CanvasRenderer keeps and reuses
+            the layers instead.
 
+            :param canvas: the canvas to draw on
+            :param size: the size of the canvas
+            :return the canvas
+            """
+            from map_maker.renderer import FloorLayer  # the renderer imports this module
+
+            canvas.config(width=size.width, height=size.height)
+            canvas.create_rectangle(0, 0, size.width, size.height, fill=Dungeon.WallTile.default_color)
+            FloorLayer(self, (self.padding_left, self.padding_top, self.cell_size)).paint(canvas)
             return canvas
 
     class Link:
-        def __init__(self, tile: Dungeon.Tile, chain: [], direction):
-            self.dungeon = tile.dungeon
-            self.floor = tile.floor
-            self.name = tile.name
-            self.row = tile.row
-            self.column = tile.column
-            self.tile: Dungeon.Tile = tile
+        """ The start of a chain of carved tiles: an entry or a staircase, and the direction the chain sets off in. """
+        __slots__ = ('floor', 'row', 'column', 'chain_id', 'direction')
+
+        def __init__(self, floor: Dungeon.Floor, row: int, column: int, chain: int, direction):
+            self.floor = floor
+            self.row = row
+            self.column = column
             self.chain_id = chain
             self.direction = direction
 
+        @property
+        def dungeon(self) -> Dungeon:
+            return self.floor.dungeon
+
+        @property
+        def tile(self) -> Dungeon.Tile:
+            return self.floor.tile(self.row, self.column)
+
+        @property
+        def name(self) -> str:
+            return self.tile.name
+
         def __str__(self):
             return self.name + ' link(' + str(self.floor.number) + ', ' + str(self.column) + ', ' \
                    + str(self.row) + ')'
 
     class Tile:
+        """
+        A tile in a cell of a floor. What every tile of a type has in common, such as its name, color and code, lives on
+        the class, so a tile object only holds its floor and position. Tiles without state are not kept at all; the
+        floor makes them from its tile array when they are asked for (see Floor.tile). Stateful tiles also hold their
+        state and color (see StatefulTile).
+        """
+        __slots__ = ('floor', 'row', 'column')
+
+        name = None
         default_color = None
+        code = None
+        stateful = False  # stateful tiles are kept in their floor's side table instead of being rebuilt on demand
+        default_walkable = True  # whether a tile of the type can be walked on in its starting state
+        interaction = None  # the name of the method that is called when a player uses the tile
+        state = None
 
-        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, name: str, row: int, column: int, color,
-                     interaction=None, state=None):
-            self.dungeon = dungeon
+        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int):
             self.floor = floor
-            self.name = name
             self.row = row
             self.column = column
-            self.color = color
-            self.interact = interaction
-            self.state = state
+
+        @property
+        def dungeon(self) -> Dungeon:
+            return self.floor.dungeon
+
+        @property
+        def color(self):
+            """ The color of the tile. """
+            return self.default_color
+
+        @property
+        def walkable(self) -> bool:
+            """ Whether the tile can be walked on. """
+            return self.default_walkable
+
+        @property
+        def interact(self):
+            """ The method that is called when a player uses the tile, or None if it does nothing. """
+            return None if self.interaction is None else getattr(self, self.interaction)
+
+        def arguments(self) -> list:
+            """ The constructor arguments after the position that recreate this tile. """
+            return [] if self.state is None else [self.state]
+
+        @property
+        def fill(self):
+            """ The color the cell of this tile is filled with. """
+            return self.color
 
         def draw(self, canvas, x1, y1, x2, y2):
+            canvas.create_rectangle(x1, y1, x2, y2, fill=self.fill)
+            self.draw_icon(canvas, x1, y1, x2, y2)
+
+        def draw_icon(self, canvas, x1, y1, x2, y2, tags=()):
+            """ Draw whatever goes on top of the filled cell. """
             pass
 
         def __str__(self):
             return self.name + ' tile(' + str(self.floor.number) + ', ' + str(self.column) + ', ' + str(self.row) + ')'
 
+    class StatefulTile(Tile):
+        """ A tile that carries a state, and a color that can change with it, of its own. """
+        __slots__ = ('color', 'state')
+        stateful = True
+
+        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int, state=None, color=None):
+            super().__init__(dungeon, floor, row, column)
+            self.state = state
+            self.color = self.default_color if color is None else color
+
     class WallTile(Tile):
+        __slots__ = ()
+        name = 'wall'
+        code = WALL
         default_color = "#656565"
-
-        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int):
-            super().__init__(dungeon, floor, 'wall', row, column, self.default_color)
+        default_walkable = False
 
         def draw(self, canvas, x1, y1, x2, y2):
             pass
 
     class FloorTile(Tile):
+        __slots__ = ()
+        name = 'floor'
+        code = FLOOR
         default_color = "white"
 
-        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int):
-            super().__init__(dungeon, floor, 'floor', row, column, self.default_color)
-
-        def draw(self, canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=self.color)
-
-    class CrackedWallTile(Tile):
+    class CrackedWallTile(StatefulTile):
+        __slots__ = ()
+        name = 'cracked wall'
+        code = CRACKED_WALL
         default_color = "#757575"
+        default_walkable = False
+        interaction = 'break_wall'
 
         def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int, state="unbroken"):
-            super().__init__(dungeon, floor, 'cracked wall', row, column, self.default_color, self.break_wall, state)
+            color = self.default_color if state == 'unbroken' else Dungeon.FloorTile.default_color
+            super().__init__(dungeon, floor, row, column, state, color)
 
-        def draw(self, canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=self.color)
+        @property
+        def walkable(self) -> bool:
+            return self.state == 'broken'
 
         def break_wall(self):
             if self.state == 'unbroken':
                 self.state = 'broken'
-                self.default_color = Dungeon.FloorTile.default_color
+                self.color = Dungeon.FloorTile.default_color
+                self.floor.changed(self.row, self.column)
 
-    class CrackedFloorTile(Tile):
+    class CrackedFloorTile(StatefulTile):
+        __slots__ = ()
+        name = 'cracked floor'
+        code = CRACKED_FLOOR
         default_color = "#EEEEEE"
+        interaction = 'break_floor'
 
         def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int, state="unbroken"):
-            super().__init__(dungeon, floor, 'cracked wall', row, column, self.default_color, self.break_floor, state)
+            color = self.default_color if state == 'unbroken' else Dungeon.PitTile.default_color
+            super().__init__(dungeon, floor, row, column, state, color)
 
-        def draw(self, canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=self.color)
+        @property
+        def walkable(self) -> bool:
+            return self.state != 'broken'
 
         def break_floor(self):
             if self.state == 'unbroken':
                 self.state = 'broken'
-                self.default_color = Dungeon.PitTile.default_color
+                self.color = Dungeon.PitTile.default_color
+                self.floor.changed(self.row, self.column)
 
     class PitTile(Tile):
+        __slots__ = ()
+        name = 'pit'
+        code = PIT
         default_color = "black"
-
-        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int):
-            super().__init__(dungeon, floor, 'pit', row, column, self.default_color, self.fall_in)
-
-        def draw(self, canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=self.color)
+        default_walkable = False
+        interaction = 'fall_in'
 
         def fall_in(self):
             pass
 
-    class EntryTile(Tile):
+    class EntryTile(StatefulTile):
+        __slots__ = ('direction',)
+        name = 'entry'
+        code = ENTRY
         arrow_color = "#4c9e62"
+        interaction = 'enter'
 
         def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int, direction):
-            super().__init__(dungeon, floor, 'entry', row, column, self.default_color, self.enter)
+            super().__init__(dungeon, floor, row, column)
             self.direction = direction
 
-        def draw(self, canvas: Canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=Dungeon.FloorTile.default_color)
+        @property
+        def fill(self):
+            return Dungeon.FloorTile.default_color
 
+        def draw_icon(self, canvas: Canvas, x1, y1, x2, y2, tags=()):
             x1 += 1
             y1 += 1
             x2 -= 1
@@ -486,73 +1149,103 @@ class Dungeon:
             y3 = (y1 + y2) / 2
 
             if self.direction == [0, -1]:  # up
-                canvas.create_polygon(x1, y2, x2, y2, x3, y3, fill=self.arrow_color, width=0)
+                canvas.create_polygon(x1, y2, x2, y2, x3, y3, fill=self.arrow_color, width=0, tags=tags)
             if self.direction == [0, 1]:  # down
-                canvas.create_polygon(x1, y1, x2, y1, x3, y3, fill=self.arrow_color, width=0)
+                canvas.create_polygon(x1, y1, x2, y1, x3, y3, fill=self.arrow_color, width=0, tags=tags)
             if self.direction == [-1, 0]:  # left
-                canvas.create_polygon(x2, y1, x2, y2, x3, y3, fill=self.arrow_color, width=0)
+                canvas.create_polygon(x2, y1, x2, y2, x3, y3, fill=self.arrow_color, width=0, tags=tags)
             if self.direction == [1, 0]:  # right
-                canvas.create_polygon(x1, y1, x1, y2, x3, y3, fill=self.arrow_color, width=0)
+                canvas.create_polygon(x1, y1, x1, y2, x3, y3, fill=self.arrow_color, width=0, tags=tags)
+
+        def arguments(self) -> list:
+            return [self.direction]
 
         def enter(self):
             pass
 
     class StaircaseUpTile(Tile):
-        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int):
-            super().__init__(dungeon, floor, 'staircase up', row, column, self.default_color, self.go_up)
+        __slots__ = ()
+        name = 'staircase up'
+        code = STAIRCASE_UP
+        interaction = 'go_up'
 
-        def draw(self, canvas: Canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=Dungeon.FloorTile.default_color)
+        @property
+        def fill(self):
+            return Dungeon.FloorTile.default_color
 
+        def draw_icon(self, canvas: Canvas, x1, y1, x2, y2, tags=()):
             x3 = (x1 + x2) / 2
             y3 = (y1 + y2) / 2
             fs = round((x2 - x1) / 2)
 
-            canvas.create_text(x3, y3, text='ä', font=('Wingdings', fs))
+            canvas.create_text(x3, y3, text='ä', font=('Wingdings', fs), tags=tags)
 
-        def go_up(self):
-            pass
+        def go_up(self) -> Dungeon.Tile:
+            """
+            Take the staircase, carving the floor above if a lazy build left it for later.
+
+            :return the staircase down that it comes out on
+            """
+            return self.dungeon.get_floor(self.floor.number + 1).tile(self.row, self.column)
 
     class StaircaseDownTile(Tile):
-        def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int):
-            super().__init__(dungeon, floor, 'staircase down', row, column, self.default_color, self.go_down)
+        __slots__ = ()
+        name = 'staircase down'
+        code = STAIRCASE_DOWN
+        interaction = 'go_down'
 
-        def draw(self, canvas: Canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=Dungeon.FloorTile.default_color)
+        @property
+        def fill(self):
+            return Dungeon.FloorTile.default_color
 
+        def draw_icon(self, canvas: Canvas, x1, y1, x2, y2, tags=()):
             x3 = (x1 + x2) / 2
             y3 = (y1 + y2) / 2
             fs = round((x2 - x1) / 2)
 
-            canvas.create_text(x3, y3, text='æ', font=('Wingdings', fs))
+            canvas.create_text(x3, y3, text='æ', font=('Wingdings', fs), tags=tags)
 
-        def go_down(self):
-            pass
+        def go_down(self) -> Dungeon.Tile:
+            """
+            Take the staircase, carving the floor below if a lazy build left it for later.
 
-    class TreasureTile(Tile):
+            :return the staircase up that it comes out on
+            """
+            return self.dungeon.get_floor(self.floor.number - 1).tile(self.row, self.column)
+
+    class TreasureTile(StatefulTile):
+        __slots__ = ()
+        name = 'treasure'
+        code = TREASURE
         icon_color = "goldenrod"
+        interaction = 'open'
 
         def __init__(self, dungeon: Dungeon, floor: Dungeon.Floor, row: int, column: int, state='closed'):
-            super().__init__(dungeon, floor, 'treasure', row, column, self.default_color, self.open, state)
+            color = self.default_color if state == 'closed' else Dungeon.FloorTile.default_color
+            super().__init__(dungeon, floor, row, column, state, color)
 
-        def draw(self, canvas: Canvas, x1, y1, x2, y2):
-            canvas.create_rectangle(x1, y1, x2, y2, fill=Dungeon.FloorTile.default_color)
+        @property
+        def fill(self):
+            return Dungeon.FloorTile.default_color
 
+        def draw_icon(self, canvas: Canvas, x1, y1, x2, y2, tags=()):
             x3 = (x1 + x2) / 2
             y3 = (y1 + y2) / 2
             fs = round((x2 - x1) / 2)
 
-            canvas.create_text(x3, y3, text='▄', font=('Arial', fs), fill=self.icon_color)
+            canvas.create_text(x3, y3, text='▄', font=('Arial', fs), fill=self.icon_color, tags=tags)
 
         def open(self):
             if self.state == 'closed':
                 self.state = 'opened'
-                self.default_color = Dungeon.FloorTile.default_color
-
-
-# window = Tk()
-# window.title('Dungeon Maker')
-# dungeon: Dungeon = Dungeon(window, cell_size=50, grid_columns=40, grid_rows=20)
-# dungeon.draw(0).grid(row=0, column=0)
-# window.mainloop()
-
+                self.color = Dungeon.FloorTile.default_color
+                self.floor.changed(self.row, self.column)
+
+    # the tile classes indexed by their tile type code
+    TILE_TYPES = (WallTile, FloorTile, CrackedWallTile, CrackedFloorTile, PitTile, EntryTile, StaircaseUpTile,
+                  StaircaseDownTile, TreasureTile)
+    # the tile classes of the features that can be placed after carving, keyed by the names used in features
+    FEATURE_TYPES = {'cracked_wall': CrackedWallTile, 'pit': PitTile, 'cracked_floor': CrackedFloorTile,
+                     'treasure': TreasureTile}
+    # whether a tile of each type can be walked on in its starting state, indexed by tile type code
+    WALKABLE = np.array([tile_type.default_walkable for tile_type in TILE_TYPES])
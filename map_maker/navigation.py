@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import heapq
+from math import inf
+
+from map_maker.analysis import UNREACHED, distance_field, padded
+from map_maker.dungeon import STAIRCASE_DOWN, STAIRCASE_UP, Dungeon
+from my_global import *
+
+STAIR_COST = 1  # the steps it takes to go up or down a staircase
+SHARED_GOAL = 2  # queries on one floor with a goal shared by at least this many are answered by one search from it
+
+
+class NavigationIndex:
+    """
+    An index for finding the way between cells of a dungeon, across floors. Make one for a dungeon and ask it for
+    distances or paths between (floor, row, column) cells:
+
+        index = NavigationIndex(dungeon)
+        index.distance((0, 5, 7), (3, 40, 12))                    # the steps between two cells
+        index.path((0, 5, 7), (3, 40, 12))                        # the cells on the way, start and goal included
+        index.distances(np.array([[0, 5, 7], [1, 2, 3]]), goals)  # the steps for many starts and goals at once
+
+    The staircases are the only way between floors, so they are the nodes of a small graph over the whole dungeon.
+    For each staircase the index keeps the distance from it to every cell of its floor, and for every pair of
+    staircases the shortest route between them, found once over that graph. A query between floors then only looks
+    up the distances from its start to the staircases of the start floor and from the staircases of the goal floor
+    to its goal, and adds the routes between; a query on one floor runs A* from its start to its goal, guided by the
+    staircase distances, unless they already prove that going by another floor is no longer. Batches of queries are
+    looked up with array operations, and the queries on one floor that share a goal, such as many monsters chasing
+    one player, are answered together by a single search out from the goal that stops once it reached every start.
+
+    The staircase distances take an int32 per cell per staircase, so mind the memory on large grids with many
+    staircases. The index is brought up to date when tiles are changed through Floor.set_tile or a tile interaction,
+    such as breaking a cracked wall.
+    """
+
+    def __init__(self, dungeon: Dungeon):
+        """
+        Create the index of a dungeon, carving any floor a lazy build left for later.
+
+        :param dungeon: the dungeon
+        """
+        self.dungeon = dungeon
+        self.versions = None  # the versions of the floors the index was made for
+        self.refresh()
+
+    def refresh(self):
+        """ Remake the index if a floor changed since it was made. It is called before every query. """
+        self.dungeon.build_all()
+        floors = self.dungeon.floors
+        versions = tuple((number, id(floor), floor.version) for number, floor in floors.items())
+        if versions == self.versions:
+            return
+
+        # every staircase, floor by floor and row by row
+        portals = [np.argwhere(np.isin(floors[number].tiles, (STAIRCASE_UP, STAIRCASE_DOWN))) for number in floors]
+        self.portals = np.concatenate([np.column_stack([np.full(len(cells), number), cells]) for number, cells in
+                                       zip(floors, portals)] or [np.empty((0, 3), dtype=np.intp)]).astype(np.intp)
+        self.floor_portals = {}  # the ids of the staircases of each floor
+        start = 0
+        for number, cells in zip(floors, portals):
+            self.floor_portals[number] = np.arange(start, start + len(cells))
+            start += len(cells)
+        self.grids = {}  # the walkable cells of each floor, flattened with a border, as bytes
+        self.landmarks = {}  # the staircase distances of each floor, flattened with a border, for the A* guesses
+        self.fields = {}  # the distances from each staircase of each floor to every cell of it
+        for number, floor in floors.items():
+            fields = self.portal_fields(floor)
+            self.grids[number] = padded(floor.walkable())[0].tobytes()
+            self.landmarks[number] = [memoryview(field.ravel()) for field in fields]
+            self.fields[number] = fields[:, 1:-1, 1:-1]
+
+        # the staircases next to each other, on a floor or up and down a staircase
+        count = len(self.portals)
+        costs = np.full((count, count), inf)
+        np.fill_diagonal(costs, 0)
+        for number, ids in self.floor_portals.items():
+            rows, columns = self.portals[ids, 1], self.portals[ids, 2]
+            steps = self.fields[number][:, rows, columns].astype(float)
+            steps[steps == UNREACHED] = inf
+            costs[np.ix_(ids, ids)] = steps
+        ids = {tuple(cell): portal for portal, cell in enumerate(self.portals.tolist())}
+        for (number, row, column), portal in ids.items():
+            if floors[number].tiles[row, column] == STAIRCASE_UP and (number + 1, row, column) in ids:
+                other = ids[number + 1, row, column]
+                costs[portal, other] = costs[other, portal] = STAIR_COST
+
+        # the shortest route between every pair of staircases, and the staircase each one goes to next
+        hops = np.tile(np.arange(count), (count, 1))
+        for middle in range(count):
+            through = costs[:, middle, None] + costs[None, middle, :]
+            better = through < costs
+            costs = np.where(better, through, costs)
+            hops = np.where(better, hops[:, middle, None], hops)
+        self.costs = costs
+        self.hops = hops
+        self.portal_ids = ids
+        self.versions = versions
+
+    @staticmethod
+    def portal_fields(floor: Dungeon.Floor) -> np.ndarray:
+        """
+        Get the distances from each staircase of a floor to every cell of it, with a border of UNREACHED cells around
+        the floor. They are kept on the floor until it changes, like its other analysis results.
+
+        :param floor: the floor
+        :return: an int32 array (staircases by rows + 2 by columns + 2) of steps, or UNREACHED (-1), in the order the
+            staircases come in row by row
+        """
+        def compute():
+            walkable = floor.walkable()
+            cells = np.argwhere(np.isin(floor.tiles, (STAIRCASE_UP, STAIRCASE_DOWN)))
+            rows, columns = floor.tiles.shape
+            fields = np.full((len(cells), rows + 2, columns + 2), UNREACHED, dtype=np.int32)
+            for number, cell in enumerate(cells):
+                fields[number, 1:-1, 1:-1] = distance_field(walkable, cell[None])
+            return fields
+        return floor.analysed('portal_fields', compute)
+
+    def distance(self, start: tuple, goal: tuple) -> int:
+        """
+        Get the fewest steps from one cell to another.
+
+        :param start: the (floor, row, column) to start from
+        :param goal: the (floor, row, column) to get to
+        :return: the steps, or UNREACHED (-1) if the goal cannot be reached
+        """
+        return int(self.distances(np.array([start]), np.array([goal]))[0])
+
+    def distances(self, starts: np.ndarray, goals: np.ndarray) -> np.ndarray:
+        """
+        Get the fewest steps for many pairs of cells at once.
+
+        :param starts: an int array (queries by 3) of the (floor, row, column) to start each query from
+        :param goals: an int array (queries by 3) of the (floor, row, column) to get to in each query
+        :return: an int64 array of the steps of each query, or UNREACHED (-1) where the goal cannot be reached
+        """
+        self.refresh()
+        starts = np.asarray(starts, dtype=np.intp).reshape(-1, 3)
+        goals = np.asarray(goals, dtype=np.intp).reshape(-1, 3)
+        steps = np.full(len(starts), inf)
+
+        pairs, groups = self.group(np.column_stack([starts[:, 0], goals[:, 0]]))
+        for (start_floor, goal_floor), queries in zip(pairs.tolist(), groups):
+            via, _, _ = self.best_portals(start_floor, goal_floor, starts[queries], goals[queries])
+            if start_floor == goal_floor:
+                via = np.minimum(via, self.floor_distances(start_floor, starts[queries, 1:], goals[queries, 1:], via))
+            steps[queries] = via
+
+        steps[np.isinf(steps)] = UNREACHED
+        return steps.astype(np.int64)
+
+    @staticmethod
+    def group(keys: np.ndarray) -> tuple:
+        """
+        Group queries by a key, such as their floors.
+
+        :param keys: an int array (queries by key length) of the key of each query
+        :return: an int array (groups by key length) of the different keys, and an int array per key of the queries
+            that have it
+        """
+        different, groups, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        return different, np.split(np.argsort(groups.ravel(), kind='stable'), np.cumsum(counts)[:-1])
+
+    def best_portals(self, start_floor: int, goal_floor: int, starts: np.ndarray, goals: np.ndarray) -> tuple:
+        """
+        Find the best way from cells of one floor to cells of another through the staircases, without going
+        straight from start to goal on one floor.
+
+        :param start_floor: the floor of every start
+        :param goal_floor: the floor of every goal
+        :param starts: an int array (queries by 3) of the (floor, row, column) of each start
+        :param goals: an int array (queries by 3) of the (floor, row, column) of each goal
+        :return: a float array of the steps of each query, inf where there is no way, and int arrays of the ids of
+            the staircase each query leaves the start floor by and the one it reaches the goal floor by, or -1
+        """
+        first, last = self.floor_portals[start_floor], self.floor_portals[goal_floor]
+        if len(first) == 0 or len(last) == 0:
+            none = np.full(len(starts), -1)
+            return np.full(len(starts), inf), none, none
+
+        leave = self.fields[start_floor][:, starts[:, 1], starts[:, 2]].T.astype(float)
+        arrive = self.fields[goal_floor][:, goals[:, 1], goals[:, 2]].T.astype(float)
+        leave[leave == UNREACHED] = inf
+        arrive[arrive == UNREACHED] = inf
+        total = leave[:, :, None] + self.costs[np.ix_(first, last)][None] + arrive[:, None, :]
+        best = total.reshape(len(starts), -1).argmin(axis=1)
+        exits, entrances = np.unravel_index(best, (len(first), len(last)))
+        return total.reshape(len(starts), -1)[np.arange(len(starts)), best], first[exits], last[entrances]
+
+    def floor_distances(self, floor_number: int, starts: np.ndarray, goals: np.ndarray, bounds: np.ndarray) \
+            -> np.ndarray:
+        """
+        Get the fewest steps for many pairs of cells of a floor without leaving it. Goals shared by at least
+        SHARED_GOAL queries get one search out from the goal; the other queries get an A* search each.
+
+        :param floor_number: the floor
+        :param starts: an int array (queries by 2) of the (row, column) to start each query from
+        :param goals: an int array (queries by 2) of the (row, column) to get to in each query
+        :param bounds: a float array of the most steps that are of interest for each query, such as the steps of
+            going by another floor
+        :return: a float array of the steps of each query, or inf where there is no way that is no longer than its
+            bound
+        """
+        walkable = self.dungeon.floors[floor_number].walkable()
+        steps = np.full(len(starts), inf)
+        cells, groups = self.group(goals)
+        for goal, queries in zip(cells.tolist(), groups):
+            if len(queries) < SHARED_GOAL or not walkable[tuple(goal)]:
+                for query in queries.tolist():
+                    route = self.search(floor_number, starts[query], goal, bounds[query])
+                    if route is not None:
+                        steps[query] = len(route) - 1
+                continue
+
+            limit = bounds[queries].max()
+            field = distance_field(walkable, np.array([goal]), None if np.isinf(limit) else limit, starts[queries])
+            found = field[starts[queries, 0], starts[queries, 1]].astype(float)
+            found[(found == UNREACHED) | ~walkable[starts[queries, 0], starts[queries, 1]]] = inf
+            steps[queries] = found
+        return steps
+
+    def search(self, floor_number: int, start, goal, bound: float = inf) -> list:
+        """
+        Find the shortest way between two cells of a floor without leaving it, with A*. The guess of the steps left
+        from a cell is the most its distances to the staircases of the floor differ from the goal's, or the straight
+        distance if that is more, which never overestimates, so the way found is a shortest one.
+
+        :param floor_number: the floor
+        :param start: the (row, column) to start from
+        :param goal: the (row, column) to get to
+        :param bound: give up on ways longer than this (default inf)
+        :return: the (row, column) of each cell on the way, start and goal included, or None if there is no way on
+            the floor that is no longer than bound
+        """
+        grid = self.grids[floor_number]
+        landmarks = self.landmarks[floor_number]
+        stride = len(self.dungeon.floors[floor_number].cols) + 2
+        start_row, start_column = int(start[0]) + 1, int(start[1]) + 1
+        goal_row, goal_column = int(goal[0]) + 1, int(goal[1]) + 1
+        origin, target = start_row * stride + start_column, goal_row * stride + goal_column
+        if origin == target:
+            return [(start_row - 1, start_column - 1)]
+        if not (grid[origin] and grid[target]):
+            return None
+
+        goal_distances = [landmark[target] for landmark in landmarks]
+        for landmark, goal_distance in zip(landmarks, goal_distances):
+            if (landmark[origin] == UNREACHED) != (goal_distance == UNREACHED):
+                return None  # one is cut off from a staircase the other can reach, so they are cut off from each other
+
+        def guess(cell: int) -> int:
+            row, column = divmod(cell, stride)
+            best = abs(row - goal_row) + abs(column - goal_column)
+            for landmark, goal_distance in zip(landmarks, goal_distances):
+                difference = landmark[cell] - goal_distance
+                if difference > best:
+                    best = difference
+                elif -difference > best:
+                    best = -difference
+            return best
+
+        offsets = (-stride, stride, -1, 1)
+        steps = {origin: 0}
+        came_from = {origin: None}
+        queue = [(guess(origin), 0, origin)]  # the guessed length, the steps taken as a negative and the cell
+        while queue:
+            estimate, taken, cell = heapq.heappop(queue)
+            if estimate > bound:  # the guesses never drop along a way, so every way left is longer than bound
+                return None
+            if cell == target:
+                break
+            taken = 1 - taken  # the steps to the neighbors; of equal guesses, the deepest cell is tried first
+            if taken - 1 > steps[cell]:
+                continue
+            for offset in offsets:
+                neighbor = cell + offset
+                if grid[neighbor] and taken < steps.get(neighbor, inf):
+                    steps[neighbor] = taken
+                    came_from[neighbor] = cell
+                    heapq.heappush(queue, (taken + guess(neighbor), -taken, neighbor))
+        else:
+            return None
+
+        route = []
+        while cell is not None:
+            row, column = divmod(cell, stride)
+            route.append((row - 1, column - 1))
+            cell = came_from[cell]
+        return route[::-1]
+
+    def descend(self, floor_number: int, portal: int, start: tuple) -> list:
+        """
+        Walk from a cell to a staircase by always stepping to a cell one step closer to it.
+
+        :param floor_number: the floor of the cell and the staircase
+        :param portal: the id of the staircase
+        :param start: the (row, column) to start from
+        :return: the (row, column) of each cell on the way, start and staircase included
+        """
+        field = self.fields[floor_number][portal - self.floor_portals[floor_number][0]]
+        rows, columns = field.shape
+        row, column = start
+        route = [(row, column)]
+        while field[row, column] > 0:
+            for row_step, column_step in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                next_row, next_column = row + row_step, column + column_step
+                if 0 <= next_row < rows and 0 <= next_column < columns and \
+                        field[next_row, next_column] == field[row, column] - 1:
+                    row, column = next_row, next_column
+                    break
+            route.append((row, column))
+        return route
+
+    def path(self, start: tuple, goal: tuple) -> list:
+        """
+        Find a shortest way from one cell to another, going up and down staircases as needed.
+
+        :param start: the (floor, row, column) to start from
+        :param goal: the (floor, row, column) to get to
+        :return: the (floor, row, column) of each cell on the way, start and goal included, with both ends of each
+            staircase that is taken, or None if the goal cannot be reached
+        """
+        self.refresh()
+        start, goal = tuple(int(value) for value in start), tuple(int(value) for value in goal)
+        via, exits, entrances = self.best_portals(start[0], goal[0], np.array([start]), np.array([goal]))
+        if start[0] == goal[0]:
+            route = self.search(start[0], start[1:], goal[1:], via[0])
+            if route is not None:
+                return [(start[0], row, column) for row, column in route]
+        if np.isinf(via[0]):
+            return None
+
+        # the staircases on the way, from the one the start floor is left by to the one the goal floor is reached by
+        portals = [int(exits[0])]
+        while portals[-1] != entrances[0]:
+            portals.append(int(self.hops[portals[-1], entrances[0]]))
+
+        path = [(start[0], row, column) for row, column in self.descend(start[0], portals[0], start[1:])]
+        for portal, next_portal in zip(portals, portals[1:]):
+            floor_number, row, column = self.portals[next_portal].tolist()
+            if floor_number == path[-1][0]:  # across the floor to the next staircase
+                route = self.descend(floor_number, next_portal, path[-1][1:])
+                path.extend((floor_number, row, column) for row, column in route[1:])
+            else:  # up or down the staircase
+                path.append((floor_number, row, column))
+        route = self.descend(goal[0], portals[-1], goal[1:])
+        path.extend((goal[0], row, column) for row, column in reversed(route[:-1]))
+        return path
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from math import erf, inf, sqrt
+
+from map_maker import analysis
+from my_global import *
+
+
+def normal_weights(low: int, high: int, mean: float, sd: float, truncate: bool = False) -> np.ndarray:
+    """
+    Get the chance of each whole number from low to high being drawn as clamp(round(normal(mean, sd)), low, high),
+    or with int() in place of round() when truncating. The clamped ends get the chance of every draw past them.
+        >>> normal_weights(0, 2, 1, 1).round(3)
+        array([0.309, 0.383, 0.309])
+
+    :param low: the lowest number
+    :param high: the highest number
+    :param mean: the mean of the normal distribution
+    :param sd: the standard deviation of the normal distribution
+    :param truncate: True to drop the fraction like int() does, which only differs from rounding down for numbers
+        below 0, so low must be at least 0. (default False)
+    :return: a float array of high - low + 1 chances that add up to 1
+    """
+    values = np.arange(low, high + 1, dtype=float)
+    lower, upper = (values, values + 1) if truncate else (values - 0.5, values + 0.5)
+    lower[0] = -inf
+    upper[-1] = inf
+
+    def cdf(x: float) -> float:
+        return 0.5 * (1 + erf((x - mean) / (sd * sqrt(2))))
+
+    return np.array([cdf(b) - cdf(a) for a, b in zip(lower, upper)])
+
+
+def choose_cells(rand: np.random.Generator, weights: np.ndarray, count: int) -> np.ndarray:
+    """
+    Draw different cells of a grid in one call, each with a chance in proportion to its weight. Cells with a weight
+    of 0 are never drawn, so a mask of the cells that can be used can simply be multiplied in.
+
+    :param rand: the random number generator
+    :param weights: a float array (rows by columns) of the weight of each cell
+    :param count: the number of cells to draw. Fewer are drawn when fewer cells have a weight.
+    :return: an int array (cells by 2) of the (row, column) of each drawn cell, in the order they were drawn
+    """
+    flat = weights.ravel()
+    candidates = np.flatnonzero(flat)
+    count = min(count, candidates.size)
+    if count == 0:
+        return np.empty((0, 2), dtype=np.intp)
+
+    chances = flat[candidates]
+    picks = rand.choice(candidates, size=count, replace=False, p=chances / chances.sum())
+    return np.stack(np.unravel_index(picks, weights.shape), axis=-1)
+
+
+# the default rules of the features placed after carving, in the order they are placed. Each feature goes on a kind of
+# cell (see PLACES), on density times the walkable cells of the floor at most, and at least min_distance steps from
+# the entries and staircases
+FEATURES = {
+    'cracked_wall': {'where': 'between_corridors', 'density': 0.01, 'min_distance': 5},
+    'pit': {'where': 'room', 'density': 0.005, 'min_distance': 5},
+    'cracked_floor': {'where': 'corridor', 'density': 0.01, 'min_distance': 3},
+    'treasure': {'where': 'room', 'density': 0.005, 'min_distance': 10},
+}
+# the kinds of cells features can be placed on
+PLACES = ('floor', 'corridor', 'dead_end', 'room', 'between_corridors')
+
+
+def shifted(grid: np.ndarray, fill) -> dict:
+    """
+    Get each cell's neighbors in one array per direction.
+
+    :param grid: an array (rows by columns)
+    :param fill: the value of the cells past the edge of the grid
+    :return: the arrays (rows by columns) of the neighbor above, below, left, right, above left, above right, below
+        left and below right of each cell, keyed by 'n', 's', 'w', 'e', 'nw', 'ne', 'sw' and 'se'
+    """
+    rows, columns = grid.shape
+    padded = np.pad(grid, 1, constant_values=fill)
+    return {name: padded[1 + row:1 + row + rows, 1 + column:1 + column + columns] for name, (row, column) in {
+        'n': (-1, 0), 's': (1, 0), 'w': (0, -1), 'e': (0, 1),
+        'nw': (-1, -1), 'ne': (-1, 1), 'sw': (1, -1), 'se': (1, 1)}.items()}
+
+
+def cell_places(floors: np.ndarray, walls: np.ndarray, walkable: np.ndarray) -> dict:
+    """
+    Sort the cells of a floor into the kinds features can be placed on, from the walkable cells around each.
+
+        floor               a plain floor tile
+        corridor            a floor tile with two walkable neighbors
+        dead_end            a floor tile with one walkable neighbor
+        room                a floor tile with three or four walkable neighbors
+        between_corridors   a wall with corridors on two opposite sides and walls on the other two
+
+    :param floors: a bool array (rows by columns) of the plain floor tiles, which are the only ones features replace
+    :param walls: a bool array (rows by columns) of the walls
+    :param walkable: a bool array (rows by columns) of the cells that can be walked on
+    :return: a bool array (rows by columns) per kind, keyed by the names in PLACES
+    """
+    counts = analysis.neighbor_counts(walkable)
+    corridors = floors & (counts == 2)
+    around = shifted(corridors, False)
+    open_around = shifted(walkable, False)
+    return {
+        'floor': floors,
+        'corridor': corridors,
+        'dead_end': floors & (counts == 1),
+        'room': floors & (counts >= 3),
+        'between_corridors': walls & (
+            (around['n'] & around['s'] & ~open_around['w'] & ~open_around['e']) |
+            (around['w'] & around['e'] & ~open_around['n'] & ~open_around['s'])),
+    }
+
+
+def removable(walkable: np.ndarray) -> np.ndarray:
+    """
+    Find the walkable cells that can be taken out without cutting any other cells off from each other: the ones whose
+    walkable neighbors are all joined up through the cells around it. As long as no two cells that are taken out touch,
+    not even at a corner, every one of them can be taken out together.
+        >>> removable(np.array([[1, 1, 1], [1, 1, 0], [0, 1, 0]], dtype=bool))
+        array([[ True, False,  True],
+               [ True, False, False],
+               [False,  True, False]])
+
+    :param walkable: a bool array (rows by columns) of the cells that can be walked on
+    :return: a bool array (rows by columns)
+    """
+    around = shifted(walkable, False)
+    joins = [around['n'] & around['ne'] & around['e'], around['e'] & around['se'] & around['s'],
+             around['s'] & around['sw'] & around['w'], around['w'] & around['nw'] & around['n']]
+    counts = analysis.neighbor_counts(walkable).astype(np.int8)
+    groups = counts - np.sum(joins, axis=0, dtype=np.int8)  # 0 when the cells around join up all the way round
+    return walkable & (counts > 0) & (groups <= 1)
+
+
+def spread_out(rand: np.random.Generator, candidates: np.ndarray) -> np.ndarray:
+    """
+    Thin out cells so no two that are left touch, not even at a corner. Each cell gets a random number and is kept
+    if its number is the lowest of the candidates around it.
+
+    :param rand: the random number generator
+    :param candidates: a bool array (rows by columns) of the cells to thin out
+    :return: a bool array (rows by columns) of the cells that are kept
+    """
+    priorities = np.where(candidates, rand.random(candidates.shape), inf)
+    lowest = np.minimum.reduce([priorities, *shifted(priorities, inf).values()])
+    return candidates & (priorities == lowest)
+
+
+def around(cells: np.ndarray, shape: tuple) -> np.ndarray:
+    """
+    Mark cells and the cells that touch them.
+
+    :param cells: an int array (cells by 2) of the (row, column) of each cell
+    :param shape: the (rows, columns) of the grid
+    :return: a bool array (rows by columns)
+    """
+    marked = np.zeros(shape, dtype=bool)
+    marked[cells[:, 0], cells[:, 1]] = True
+    return np.logical_or.reduce([marked, *shifted(marked, False).values()])
+
+
+def reach(distances: np.ndarray) -> np.ndarray:
+    """
+    Get the steps from the nearest source to each cell, or to the walkable cell next to it that is nearest for cells
+    that cannot be walked on, such as walls that might be broken through.
+
+    :param distances: an int array (rows by columns) of the steps from the nearest source, or -1 where it cannot be
+        reached, such as the one of analysis.distance_field
+    :return: a float array (rows by columns) of steps, or inf where nothing near can be reached
+    """
+    steps = np.where(distances < 0, inf, distances)
+    nearest = np.minimum.reduce([shifted(steps, inf)[name] for name in 'nswe']) + 1
+    return np.where(distances < 0, nearest, steps)
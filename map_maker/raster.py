@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import struct
+import zlib
+from functools import lru_cache
+
+from map_maker.dungeon import ENTRY, STAIRCASE_DOWN, STAIRCASE_UP, TREASURE, WALL, Dungeon
+from my_global import *
+
+# the tkinter color names the tiles use
+COLOR_NAMES = {
+    'white': (255, 255, 255),
+    'black': (0, 0, 0),
+    'goldenrod': (218, 165, 32),
+}
+ICON_TILES = (ENTRY, STAIRCASE_UP, STAIRCASE_DOWN, TREASURE)
+MIN_ICON_SIZE = 4  # cells smaller than this many pixels are drawn without icons
+
+
+def rgb(color: str) -> tuple:
+    """
+    Turn a tkinter color into red, green and blue values.
+        >>> rgb('#4c9e62')
+        (76, 158, 98)
+        >>> rgb('white')
+        (255, 255, 255)
+
+    :param color: a color name or a #RRGGBB color
+    :return: the red, green and blue values from 0 to 255
+    """
+    if color.startswith('#'):
+        return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return COLOR_NAMES[color.lower()]
+
+
+@lru_cache()
+def palette() -> np.ndarray:
+    """
+    Get the color of every tile type, taken from the default_color of the tile classes. Tiles that have no color of
+    their own, such as entries and staircases, sit on a floor tile.
+
+    :return: a (tile types by 3) uint8 array indexed by tile type code
+    """
+    floor_color = Dungeon.FloorTile.default_color
+    return np.array([rgb(tile_type.default_color or floor_color) for tile_type in Dungeon.TILE_TYPES],
+                    dtype=np.uint8)
+
+
+@lru_cache()
+def sprite(code: int, cell_size: int, direction: tuple = None) -> tuple:
+    """
+    Get the icon of a tile type as a mask over one cell. Sprites are made once per tile type, cell size and
+    direction.
+
+    :param code: the tile type code
+    :param cell_size: the width/height of the cell in pixels
+    :param direction: the direction of an entry arrow (default None)
+    :return: a (cell_size by cell_size) bool mask and the red, green and blue values of the icon
+    """
+    y, x = np.mgrid[0:cell_size, 0:cell_size] + 0.5
+    last = cell_size - 1.0
+    middle = cell_size / 2
+
+    if code == ENTRY:  # a triangle from one side of the cell to its middle, pointing into the dungeon
+        column, row = direction
+        depth, across = (x, y) if row == 0 else (y, x)
+        if column == -1 or row == -1:  # pointing left or up: the wide side is on the far edge
+            depth = cell_size - depth
+        mask = (depth >= 1) & (depth <= middle) & (np.abs(across - middle) <= (middle - depth) + 0.5)
+        return mask, rgb(Dungeon.EntryTile.arrow_color)
+
+    if code in (STAIRCASE_UP, STAIRCASE_DOWN):  # three steps, climbing to the right for up and to the left for down
+        steps = np.floor(x * 3 / cell_size)
+        if code == STAIRCASE_DOWN:
+            steps = 2 - steps
+        inset = max(1, cell_size // 6)
+        top = inset + (2 - steps) * (cell_size - 2 * inset) / 3
+        mask = (y >= top) & (y <= cell_size - inset) & (x >= inset) & (x <= last - inset + 1)
+        return mask, rgb('black')
+
+    if code == TREASURE:  # a low chest in the lower middle of the cell
+        mask = (np.abs(x - middle) <= cell_size / 4) & (y >= middle) & (y <= middle + cell_size / 4)
+        return mask, rgb(Dungeon.TreasureTile.icon_color)
+
+    return np.zeros((cell_size, cell_size), dtype=bool), (0, 0, 0)
+
+
+def floor_image(floor: Dungeon.Floor, cell_size: int = None, padding: int = None) -> np.ndarray:
+    """
+    Draw a floor as an image without tkinter. The cells are colored with one palette lookup for the whole floor and
+    then scaled up, and the icons are stamped on from cached sprites.
+
+    :param floor: the floor to draw
+    :param cell_size: the width/height of the cells in pixels (default the dungeon's cell size)
+    :param padding: the wall colored border on each side of the map in pixels. Use None for the dungeon's padding,
+        which can differ between the sides and the top and bottom when it has a fixed canvas size, so the image is
+        as big as the canvas. (default None)
+    :return: a (height by width by 3) uint8 RGB array
+    """
+    dungeon = floor.dungeon
+    cell_size = int(dungeon.cell_size if cell_size is None else cell_size)
+    if padding is None:  # a padding that is not a whole number of pixels leaves the odd pixel at the bottom/right
+        size = dungeon.padding_size
+        top, left = int(size.top), int(size.left)
+        bottom, right = int(round(size.top + size.bottom)) - top, int(round(size.left + size.right)) - left
+    else:
+        top = bottom = left = right = int(round(padding))
+    rows, columns = floor.tiles.shape
+    colors = palette()
+
+    cells = colors[floor.tiles]
+    for (row, column), tile in floor.stateful.items():  # stateful tiles can change color as they are used
+        cells[row, column] = rgb(tile.fill)
+
+    image = np.empty((top + rows * cell_size + bottom, left + columns * cell_size + right, 3), dtype=np.uint8)
+    image[:] = colors[WALL]
+    image[top:top + rows * cell_size, left:left + columns * cell_size] = \
+        cells.repeat(cell_size, axis=0).repeat(cell_size, axis=1)
+
+    if cell_size >= MIN_ICON_SIZE:
+        for row, column in np.argwhere(np.isin(floor.tiles, ICON_TILES)).tolist():
+            code = int(floor.tiles[row, column])
+            direction = tuple(floor.stateful[row, column].direction) if code == ENTRY else None
+            mask, color = sprite(code, cell_size, direction)
+            y = top + row * cell_size
+            x = left + column * cell_size
+            image[y:y + cell_size, x:x + cell_size][mask] = color
+
+    return image
+
+
+def png_bytes(image: np.ndarray) -> bytes:
+    """
+    Encode an RGB image as a PNG file.
+
+    :param image: a (height by width by 3) uint8 array
+    :return: the PNG file
+    """
+    height, width, _ = image.shape
+    scanlines = np.zeros((height, width * 3 + 1), dtype=np.uint8)  # each line starts with filter type 0 (none)
+    scanlines[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),  # 8 bit RGB
+        chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)),
+        chunk(b'IEND', b''),
+    ])
+
+
+def export_png(dungeon: Dungeon, path: str, floor_number: int = 0, cell_size: int = None, padding: int = None):
+    """
+    Save a floor of a dungeon as a PNG image, building the dungeon first if needed.
+
+    :param dungeon: the dungeon
+    :param path: the file to save to
+    :param floor_number: the number of the floor to save (default 0)
+    :param cell_size: the width/height of the cells in pixels. Use a small size such as 2 for thumbnails.
+        (default the dungeon's cell size)
+    :param padding: the wall colored border on each side of the map in pixels, like in floor_image (default None)
+    """
+    floor = dungeon.get_floor(floor_number)
+    if floor is None:
+        raise ValueError('the dungeon has no floor %d' % floor_number)
+
+    with open(path, 'wb') as file:
+        file.write(png_bytes(floor_image(floor, cell_size, padding)))
@@ -0,0 +1,181 @@
+from tkinter import *
+
+from map_maker.dungeon import WALL, Dungeon
+from my_global import *
+
+CELL_TAG = 'cell'  # the filled rectangle of each open cell
+ICON_TAG = 'icon'  # the arrows, staircases and treasure drawn on top of the cells
+
+
+class FloorLayer:
+    """ The canvas items of one drawn floor, kept under a tag of their own so the floor can be hidden and shown. """
+
+    def __init__(self, floor: Dungeon.Floor, layout: tuple):
+        """
+        Create a new, still empty, layer.
+
+        :param floor: the floor the layer shows
+        :param layout: the left padding, top padding and cell size the floor is drawn with
+        """
+        self.floor = floor
+        self.layout = layout
+        self.version = None  # the version of the floor the items were last drawn from
+        self.tag = 'floor%d' % floor.number
+        self.cells = {}  # the rectangle item of each open cell, keyed by (row, column)
+
+    def paint(self, canvas: Canvas, cells=None):
+        """
+        Bring the items of the layer up to date with its floor. Existing cell items are recolored, cells that were
+        opened get new items, and the icons are drawn again.
+
+        :param canvas: the canvas the layer is on
+        :param cells: the (row, column) of the cells to paint. Use None to paint the whole floor. (default None)
+        """
+        floor = self.floor
+        if cells is None:
+            canvas.delete(self.tag + '&&' + ICON_TAG)
+            cells = set(self.cells)
+            cells.update(map(tuple, np.argwhere(floor.tiles != WALL).tolist()))
+            for row, column in cells:
+                self.paint_cell(canvas, floor, row, column)
+        else:
+            for row, column in cells:
+                canvas.delete(self.icon_tag(row, column))
+                self.paint_cell(canvas, floor, row, column)
+
+        self.version = floor.version
+
+    def paint_cell(self, canvas: Canvas, floor: Dungeon.Floor, row: int, column: int):
+        """
+        Draw the tile in one cell, reusing its rectangle item if it has one. Its old icon must already be gone.
+
+        :param canvas: the canvas the layer is on
+        :param floor: the floor of the layer
+        :param row: the row of the cell
+        :param column: the column of the cell
+        """
+        item = self.cells.get((row, column))
+        if floor.tiles[row, column] == WALL:
+            if item is not None:  # the cell turned back into a wall
+                canvas.delete(self.cells.pop((row, column)))
+            return
+
+        padding_left, padding_top, cell_size = self.layout
+        tile = floor.tile(row, column)
+        x1 = padding_left + cell_size * column
+        y1 = padding_top + cell_size * row
+        x2 = x1 + cell_size
+        y2 = y1 + cell_size
+
+        if item is None:
+            self.cells[row, column] = canvas.create_rectangle(x1, y1, x2, y2, fill=tile.fill,
+                                                              tags=(self.tag, CELL_TAG))
+        else:
+            canvas.itemconfig(item, fill=tile.fill)
+        tile.draw_icon(canvas, x1, y1, x2, y2, tags=(self.tag, ICON_TAG, self.icon_tag(row, column)))
+
+    def icon_tag(self, row: int, column: int) -> str:
+        """ The tag of the icon items of one cell. """
+        return '%s_%d_%d' % (self.tag, row, column)
+
+
+class CanvasRenderer:
+    """
+    Draws the floors of a dungeon onto a tkinter canvas. The canvas is only created once something is drawn.
+
+    Each floor is drawn once into a layer of canvas items that is kept. Changing floors hides the layer on show and
+    shows the layer of the other floor, so going back to a floor that was already drawn does not draw it again. A
+    layer is drawn again when the dungeon is rebuilt or the map is resized. When tiles of a floor change, only their
+    cells are painted again, either the next time the floor is drawn or on refresh().
+    """
+
+    def __init__(self, window: Tk, dungeon: Dungeon):
+        """
+        Create a new renderer.
+
+        :param window: the tkinter window that the dungeon will be displayed in.
+        :param dungeon: the dungeon to be drawn
+        """
+        self.window = window
+        self.dungeon = dungeon
+        self._canvas = None
+        self.background = None  # the wall colored rectangle behind the whole map
+        self.layers = {}  # the drawn layer of each floor, keyed by floor number
+        self.shown = None  # the layer on show
+
+    @property
+    def canvas(self) -> Canvas:
+        """ The canvas the floors are drawn on. """
+        if self._canvas is None:
+            size = self.dungeon.canvas_size
+            self._canvas = Canvas(self.window, width=size.width, height=size.height)
+        return self._canvas
+
+    def invalidate(self, floor_number: int = None):
+        """
+        Throw away drawn layers so they are drawn from scratch the next time they are shown.
+
+        :param floor_number: the floor whose layer is thrown away. Use None for every floor. (default None)
+        """
+        numbers = list(self.layers) if floor_number is None else [floor_number]
+        for number in numbers:
+            layer = self.layers.pop(number, None)
+            if layer is not None:
+                self.canvas.delete(layer.tag)
+                if layer is self.shown:
+                    self.shown = None
+
+    def refresh(self):
+        """ Paint the cells of the floor on show whose tiles changed since it was last painted. """
+        layer = self.shown
+        if layer is not None and layer.version != layer.floor.version:
+            layer.paint(self.canvas, layer.floor.changed_since(layer.version))
+
+    def draw(self, floor_number: int = 0) -> Canvas:
+        """
+        Build and draw the different layers of the map.
+
+        :param floor_number: the number of the floor that will be drawn
+        :return the map as a set of tkinter canvases
+        """
+        canvas = self.canvas
+        floor = self.dungeon.get_floor(floor_number)
+        size = self.dungeon.canvas_size
+
+        canvas.config(width=size.width, height=size.height)
+        if self.background is None:
+            self.background = canvas.create_rectangle(0, 0, size.width, size.height,
+                                                      fill=Dungeon.WallTile.default_color)
+        else:
+            canvas.coords(self.background, 0, 0, size.width, size.height)
+
+        layout = (self.dungeon.padding_size.left, self.dungeon.padding_size.top, self.dungeon.cell_size)
+        layer = self.layers.get(floor_number)
+        if layer is not None and (layer.floor is not floor or layer.layout != layout):  # rebuilt or resized
+            self.invalidate(floor_number)
+            layer = None
+
+        if layer is not self.shown and self.shown is not None:
+            canvas.itemconfig(self.shown.tag, state=HIDDEN)
+            self.shown = None
+        if floor is None:
+            return canvas
+
+        if layer is None:
+            layer = self.layers[floor_number] = FloorLayer(floor, layout)
+        if layer.version is None:
+            layer.paint(canvas)
+        elif layer.version != floor.version:
+            layer.paint(canvas, floor.changed_since(layer.version))
+        if layer is not self.shown:
+            canvas.itemconfig(layer.tag, state=NORMAL)
+            self.shown = layer
+
+        return canvas
+
+
+# window = Tk()
+# window.title('Dungeon Maker')
+# dungeon: Dungeon = Dungeon(cell_size=50, grid_columns=40, grid_rows=20)
+# CanvasRenderer(window, dungeon).draw(0).grid(row=0, column=0)
+# window.mainloop()
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import sys
+from mmap import ACCESS_COPY, mmap as map_file
+
+from map_maker.dungeon import ENTRY, STAIRCASE_UP, Dungeon
+from my_global import *
+
+MAGIC = b'DUNGEON\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sII')  # magic, format version, byte length of the JSON header
+ALIGNMENT = 64  # the tile block starts on a multiple of this many bytes
+# a mapping keeps its own copy of the file descriptor unless told not to, which only Python 3.13+ can on Unix
+UNTRACKED = {'trackfd': False} if sys.version_info >= (3, 13) and os.name != 'nt' else {}
+
+
+def data_offset(header_length: int) -> int:
+    """
+    Get where the tile block of a saved dungeon starts.
+
+    :param header_length: the byte length of the JSON header
+    :return: the offset of the tile block in bytes
+    """
+    end = HEADER.size + header_length
+    return -(-end // ALIGNMENT) * ALIGNMENT
+
+
+def save(dungeon: Dungeon, path: str):
+    """
+    Save a dungeon in the binary dungeon format, building it first if needed.
+
+    The file starts with the magic bytes, the format version and the length of a JSON header. The header holds the
+    settings, the floor numbers (bottom to top), the entries, the up staircases (the down staircase is in the same cell
+    of the next floor) and the stateful tiles of each floor. The tile type arrays of all floors follow as one raw
+    uint8 block of floors by rows by columns. The file is written under a temporary name and then renamed, so readers
+    never see a half written dungeon.
+
+    :param dungeon: the dungeon to save
+    :param path: the file to save to
+    """
+    dungeon.build_all()
+
+    numbers = sorted(dungeon.floors)
+    grids = np.stack([dungeon.floors[number].tiles for number in numbers]).astype(np.uint8, copy=False)
+    header = json.dumps({
+        'settings': dungeon.settings(),
+        'floors': numbers,
+        'shape': list(grids.shape),
+        'entries': [[tile.row, tile.column, *tile.arguments()] for tile in dungeon.floors[0].stateful.values()
+                    if tile.code == ENTRY],
+        'staircases': [[number, row, column] for number in numbers
+                       for row, column in np.argwhere(dungeon.floors[number].tiles == STAIRCASE_UP).tolist()],
+        'stateful': {str(number): [[tile.row, tile.column, tile.code, *tile.arguments()]
+                                   for tile in dungeon.floors[number].stateful.values()] for number in numbers},
+    }, separators=(',', ':')).encode('utf-8')
+
+    offset = data_offset(len(header))
+    with open(path + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        file.write(b'\x00' * (offset - HEADER.size - len(header)))
+        file.write(grids.tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def read_header(path: str) -> dict:
+    """
+    Read the JSON header of a saved dungeon without touching its tiles.
+
+    :param path: the saved dungeon
+    :return: the header, with the offset of the tile block added as 'offset'
+    """
+    with open(path, 'rb') as file:
+        magic, version, length = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('%s is not a saved dungeon' % path)
+        if version > FORMAT_VERSION:
+            raise ValueError('%s uses dungeon format version %d, but only versions up to %d can be read'
+                             % (path, version, FORMAT_VERSION))
+        header = json.loads(file.read(length).decode('utf-8'))
+    header['offset'] = data_offset(length)
+    return header
+
+
+def load(path: str, mmap: bool = True) -> Dungeon:
+    """
+    Load a saved dungeon without building it again.
+
+    Before Python 3.13, and on Windows, a memory-mapped dungeon holds the file open until its mapping is gone, so
+    loading many dungeons at once can run out of file descriptors. Load them with mmap=False, or call release() on
+    each once it is no longer needed as it was loaded.
+
+    :param path: the saved dungeon
+    :param mmap: memory-map the tile block instead of reading it, so tiles are only read from disk when they are
+        used. The mapping is copy-on-write: changing a tile never changes the file. (default True)
+    :return: the dungeon
+    """
+    header = read_header(path)
+    shape = tuple(header['shape'])
+    count = int(np.prod(shape))
+    if mmap:
+        with open(path, 'rb') as file:
+            mapping = map_file(file.fileno(), 0, access=ACCESS_COPY, **UNTRACKED)
+        grids = np.frombuffer(mapping, dtype=np.uint8, count=count, offset=header['offset']).reshape(shape)
+    else:
+        grids = np.fromfile(path, dtype=np.uint8, count=count, offset=header['offset']).reshape(shape)
+
+    dungeon = Dungeon(**header['settings'])
+    for number, grid in zip(header['floors'], grids):
+        floor = Dungeon.Floor(dungeon, number, grid)
+        for row, column, code, *arguments in header['stateful'][str(number)]:
+            floor.stateful[row, column] = Dungeon.TILE_TYPES[code](dungeon, floor, row, column, *arguments)
+    dungeon.built = True
+    return dungeon
+
+
+def release(dungeon: Dungeon):
+    """
+    Read the tiles of a dungeon loaded with load() into memory, so its memory mapping, and with it the file, is
+    closed once nothing else uses it. Floors whose tiles do not share memory with anything are left as they are.
+
+    :param dungeon: the loaded dungeon
+    """
+    for floor in dungeon.floors.values():
+        if floor.tiles.base is not None:
+            floor.tiles = floor.tiles.copy()
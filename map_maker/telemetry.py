@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from time import perf_counter
+
+# the carving counters that are added up over every floor
+FLOOR_COUNTERS = ('carved', 'walk_steps', 'rejected_steps', 'direction_changes', 'merges')
+
+
+class BuildStats:
+    """
+    Timings and counters of the last build of a dungeon. Dungeons only measure their builds when they are given one:
+
+        dungeon = Dungeon(stats=BuildStats())
+        dungeon.stats.subscribe(lambda event, data: print(event, data))
+        dungeon.build()
+        dungeon.stats.phases     # {'entries': ..., 'staircases': ..., 'carving': ..., 'walk': ..., 'merge': ...}
+        dungeon.stats.floors[0]  # {'carved': ..., 'walk_steps': ..., 'rejected_steps': ..., ...}
+
+    Listeners are called with 'phase' and the name and seconds of each phase as it ends, 'progress' and the tiles
+    carved so far while floors are carved, 'floor' and the counters of each floor once it is carved, and 'build' and
+    the totals once the build is done. Listeners are called on the thread that builds.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self.phases = {}  # the seconds spent in each phase, keyed by phase name
+        self.floors = {}  # the counters of each floor, keyed by floor number
+
+    def reset(self):
+        """ Forget the measurements of the previous build. """
+        self.phases = {}
+        self.floors = {}
+
+    def subscribe(self, callback):
+        """
+        Have a function called with every measurement.
+
+        :param callback: called with the name of the event and its data
+        """
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling a function that was subscribed.
+
+        :param callback: the function given to subscribe()
+        """
+        self.listeners.remove(callback)
+
+    def publish(self, event: str, data: dict):
+        """
+        Call every listener with an event.
+
+        :param event: the name of the event
+        :param data: the data of the event
+        """
+        for callback in list(self.listeners):
+            callback(event, data)
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time the code in a with block as a phase of the build.
+
+        :param name: the name of the phase
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, perf_counter() - start)
+
+    def add_phase(self, name: str, seconds: float):
+        """
+        Record time spent in a phase of the build. Time given for a phase more than once is added up.
+
+        :param name: the name of the phase
+        :param seconds: the time spent
+        """
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.publish('phase', {'name': name, 'seconds': seconds})
+
+    def add_floor(self, floor_number: int, counters: dict):
+        """
+        Record the counters of a floor.
+
+        :param floor_number: the number of the floor
+        :param counters: the counters, such as the ones carve_floor returns
+        """
+        floor = self.floors.setdefault(floor_number, {})
+        for key, value in counters.items():
+            floor[key] = floor.get(key, 0) + value
+        self.publish('floor', {'number': floor_number, **floor})
+
+    @property
+    def totals(self) -> dict:
+        """ The counters added up over every floor. """
+        return {key: sum(floor.get(key, 0) for floor in self.floors.values()) for key in FLOOR_COUNTERS}
+
+    def finish(self):
+        """ Tell the listeners that the build is done. """
+        self.publish('build', {'phases': dict(self.phases), 'totals': self.totals})
+
+    def to_dict(self) -> dict:
+        """
+        Get the measurements as plain data that can be saved as JSON.
+
+        :return the phases, the counters of each floor and the totals
+        """
+        return {'phases': dict(self.phases), 'floors': {str(number): dict(floor) for number, floor in
+                                                        self.floors.items()}, 'totals': self.totals}
@@ -112,3 +112,73 @@ def clamp_float(value: float, low: float = 0, high: float = sys.maxsize) -> floa
         return high
 
     return value
+
+
+class DisjointSet:
+    """
+    A disjoint-set (union-find) forest over the elements 0 to size - 1, using path compression and union by rank.
+        >>> sets = DisjointSet(3)
+        >>> sets.find(0) == sets.find(2)
+        False
+        >>> _ = sets.union(0, 2)
+        >>> sets.find(0) == sets.find(2)
+        True
+        >>> sets.count  # the number of separate sets
+        2
+    """
+
+    def __init__(self, size: int = 0):
+        """
+        Create a forest where every element starts in a set of its own.
+
+        :param size: the number of elements to start with (default 0)
+        """
+        self.parent = list(range(size))
+        self.rank = [0] * size
+        self.count = size
+
+    def add(self) -> int:
+        """
+        Add a new element in a set of its own.
+
+        :return: the new element
+        """
+        element = len(self.parent)
+        self.parent.append(element)
+        self.rank.append(0)
+        self.count += 1
+        return element
+
+    def find(self, element: int) -> int:
+        """
+        Find the root of the set that holds the element, halving the path to it on the way.
+
+        :param element: the element to look up
+        :return: the root element of its set
+        """
+        parent = self.parent
+        while parent[element] != element:
+            parent[element] = parent[parent[element]]
+            element = parent[element]
+        return element
+
+    def union(self, a: int, b: int) -> int:
+        """
+        Merge the sets that hold the two elements.
+
+        :param a: an element of the first set
+        :param b: an element of the second set
+        :return: the root of the merged set
+        """
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return a
+
+        if self.rank[a] < self.rank[b]:
+            a, b = b, a
+        self.parent[b] = a
+        if self.rank[a] == self.rank[b]:
+            self.rank[a] += 1
+        self.count -= 1
+        return a
@@ -0,0 +1,45 @@
+import hashlib
+import json
+
+import numpy as np
+
+from map_maker.carving import carve_events, carve_floor
+
+
+def run(events) -> tuple:
+    """ Go through a carving generator, giving its events and its result. """
+    seen = []
+    while True:
+        try:
+            seen.append(next(events))
+        except StopIteration as stop:
+            return seen, stop.value
+
+
+def test_frontier_joins_touching_starts_that_were_joined_onto_other_chains():
+    starts = [(5, 3, (0, 1)), (5, 6, (0, 1)), (5, 4, (0, 1)), (5, 5, (0, 1))]
+    open_cells = np.zeros((12, 12), dtype=bool)
+    for row, column, _ in starts:
+        open_cells[row, column] = True
+
+    events, (cells, counters) = run(carve_events(open_cells, starts, total_links=4, seed=0, engine='frontier'))
+
+    assert [event for event, _ in events] == ['merge'] * 3
+    assert len(cells) == counters['carved'] == 0
+
+
+def test_compat_takes_the_walk_of_the_carver_before_batching():
+    # the digests of the cells the carver carved, in order, before its random numbers were drawn in blocks
+    cases = [
+        ((15, 20), [(0, 7, (0, 1)), (9, 12, (1, 0)), (4, 3, (0, -1))], 90, 7, 'a15780ab4721a15e'),
+        ((30, 30), [(29, 14, (0, -1)), (10, 10, (1, 0))], 400, np.random.SeedSequence(11, spawn_key=(2,)),
+         'f1d3cda9d23f60f4'),
+    ]
+    for shape, starts, total_links, seed, digest in cases:
+        open_cells = np.zeros(shape, dtype=bool)
+        for row, column, _ in starts:
+            open_cells[row, column] = True
+
+        cells, _ = carve_floor(open_cells, starts, total_links, seed, 'compat')
+
+        assert hashlib.sha256(json.dumps(cells.tolist()).encode()).hexdigest()[:16] == digest
@@ -0,0 +1,97 @@
+import numpy as np
+
+from map_maker import raster
+from map_maker.cache import DungeonCache
+from map_maker.dungeon import ENTRY, STAIRCASE_DOWN, STAIRCASE_UP, Dungeon
+
+
+def make_dungeon(**settings) -> Dungeon:
+    return Dungeon(**{'seed': 5, 'grid_columns': 30, 'grid_rows': 20, 'top_floor': 2, 'bottom_floor': -1,
+                      **settings})
+
+
+def check_layout(dungeon: Dungeon):
+    """ Check that the staircases of each floor meet the floor above and that every entry tile has its state. """
+    for number in range(dungeon.bottom_floor, dungeon.top_floor):
+        up = np.argwhere(dungeon.floors[number].tiles == STAIRCASE_UP)
+        down = np.argwhere(dungeon.floors[number + 1].tiles == STAIRCASE_DOWN)
+        assert up.tolist() == down.tolist()
+        for row, column in up.tolist():
+            assert dungeon.floors[number].tile(row, column).go_up().code == STAIRCASE_DOWN
+
+    ground = dungeon.floors[0]
+    entries = {tuple(cell) for cell in np.argwhere(ground.tiles == ENTRY).tolist()}
+    assert entries
+    assert entries == {cell for cell, tile in ground.stateful.items() if tile.code == ENTRY}
+
+
+def tiles_of(dungeon: Dungeon) -> dict:
+    return {number: floor.tiles.copy() for number, floor in dungeon.floors.items()}
+
+
+def test_lazy_rebuild_takes_matching_floors_from_the_cache():
+    dungeon = make_dungeon(lazy=True, cache=DungeonCache())
+    dungeon.get_floor(0)
+    dungeon.set_engine('frontier')  # leaves the dungeon unbuilt, so the next get_floor builds it again
+    for number in (0, 1, 2, -1):
+        dungeon.get_floor(number)
+
+    assert dungeon.cache.counters()['hits'] == 1
+    check_layout(dungeon)
+
+
+def test_eager_rebuild_takes_matching_floors_from_the_cache():
+    cache = DungeonCache()
+    dungeon = make_dungeon(cache=cache)
+    dungeon.build()
+    first = tiles_of(dungeon)
+    dungeon.set_tile_count(0, 0.2)
+    dungeon.build()
+
+    assert cache.counters()['hits'] == len(dungeon.floors)
+    check_layout(dungeon)
+    raster.floor_image(dungeon.floors[0])
+    for number, tiles in tiles_of(dungeon).items():
+        assert np.array_equal(tiles, first[number])
+
+
+def test_dropped_build_events_leave_the_dungeon_as_a_new_one_would_build():
+    fresh = make_dungeon()
+    fresh.build()
+
+    dungeon = make_dungeon()
+    events = dungeon.build_events()
+    for _ in range(50):
+        next(events)
+    events.close()
+    dungeon.get_floor(0)
+
+    check_layout(dungeon)
+    for number, tiles in tiles_of(fresh).items():
+        assert np.array_equal(dungeon.floors[number].tiles, tiles)
+
+
+def test_floors_come_out_the_same_however_many_workers_carve_them():
+    serial = make_dungeon()
+    serial.build(workers=1)
+    parallel = make_dungeon()
+    parallel.build(workers=2)
+
+    check_layout(parallel)
+    for number, tiles in tiles_of(serial).items():
+        assert np.array_equal(parallel.floors[number].tiles, tiles)
+
+
+def test_lazy_floors_come_out_the_same_in_any_order_and_match_an_eager_build():
+    eager = make_dungeon()
+    eager.build()
+
+    for order in ((-1, 0, 1, 2), (2, 1, 0, -1), (1, -1, 2, 0)):
+        lazy = make_dungeon(lazy=True)
+        for number in order:
+            lazy.get_floor(number)
+
+        assert not lazy.pending
+        check_layout(lazy)
+        for number, tiles in tiles_of(eager).items():
+            assert np.array_equal(lazy.floors[number].tiles, tiles)
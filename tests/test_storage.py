@@ -0,0 +1,48 @@
+import numpy as np
+
+from map_maker import raster, storage
+from map_maker.dungeon import TREASURE, Dungeon
+from map_maker.placement import FEATURES
+
+
+def make_dungeon(**settings) -> Dungeon:
+    """ A dungeon with a fixed canvas size and features, with the first treasure of each floor opened. """
+    dungeon = Dungeon(**{'seed': 8, 'canvas_width': 1000, 'canvas_height': 710, 'top_floor': 1, 'bottom_floor': -1,
+                         'features': FEATURES, **settings})
+    dungeon.build_all()
+    for floor in dungeon.floors.values():
+        treasures = [tile for tile in floor.stateful.values() if tile.code == TREASURE]
+        assert treasures
+        treasures[0].open()
+    return dungeon
+
+
+def stateful_of(floor: Dungeon.Floor) -> dict:
+    return {cell: (tile.code, tile.arguments(), tile.fill, tile.color) for cell, tile in floor.stateful.items()}
+
+
+def check_same(loaded: Dungeon, dungeon: Dungeon):
+    """ Check that a loaded dungeon has the floors, stateful tiles and sizes of the dungeon it was saved from. """
+    assert sorted(loaded.floors) == sorted(dungeon.floors)
+    for number, floor in dungeon.floors.items():
+        other = loaded.floors[number]
+        assert np.array_equal(other.tiles, floor.tiles)
+        assert stateful_of(other) == stateful_of(floor)
+    assert vars(loaded.canvas_size) == vars(dungeon.canvas_size)
+    assert vars(loaded.padding_size) == vars(dungeon.padding_size)
+    assert raster.floor_image(loaded.floors[0]).shape == raster.floor_image(dungeon.floors[0]).shape
+
+
+def test_save_and_load_give_back_the_dungeon(tmp_path):
+    dungeon = make_dungeon()
+    path = str(tmp_path / 'dungeon.dgn')
+    storage.save(dungeon, path)
+
+    check_same(storage.load(path), dungeon)
+    check_same(storage.load(path, mmap=False), dungeon)
+
+
+def test_to_dict_and_from_dict_give_back_the_dungeon():
+    dungeon = make_dungeon()
+
+    check_same(Dungeon.from_dict(dungeon.to_dict()), dungeon)